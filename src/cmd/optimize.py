@@ -0,0 +1,150 @@
+from typing import List, Dict
+
+import os
+import copy
+import click
+import logging
+import itertools
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas
+
+from src.domain.trading_strategies import TradingStrategy, bollinger, dma, indicators
+from src.domain.exchanges import utils
+from src.gateways.backtest import backtest, exits, vectorized_backtest
+
+
+@click.command()
+@click.option('--trading-strategies', help='Define the trading strategies to be used, separated by comma. (options: bollinger|dma)')
+@click.option('--min-relative-bands-delta', help='Values of bollinger.minRelativeBandsDelta to try, as a list (0.02,0.04) or a range (start:stop:step). (default: config value)')
+@click.option('--stop-loss', help='Values of serialTrader.stopLossPercentage to try, as a list or a range. (default: config value)')
+@click.option('--stop-gain', help='Values of serialTrader.stopGainPercentage to try, as a list or a range. (default: config value)')
+@click.option('--max-workers', type=int, default=os.cpu_count(), help='Define the number of backtests run in parallel. (default: number of CPUs)')
+@click.option('--top', type=int, default=20, help='Define the number of best results reported. (default: 20)')
+@click.pass_context
+def optimize(ctx, trading_strategies, min_relative_bands_delta, stop_loss, stop_gain, max_workers, top):
+    """
+    Optimize searches the Serial Trader parameters that perform best on the
+    historical data of the backtest exchange.
+
+    Every combination of the given parameter values is simulated with the
+    vectorized backtest, fanned out over a pool of processes, and the results
+    are reported as a table ranked by the final balance.
+
+    The historical klines are enriched with indicators only once and shared
+    read-only with all processes through a memory-mapped file.
+    """
+    config = ctx.obj['config']
+
+    trading_strategies_list = str(trading_strategies).split(',')
+    if 'bollinger' not in trading_strategies_list and 'dma' not in trading_strategies_list:
+        raise ValueError('No valid strategy found in: %s' % trading_strategies)
+
+    grid = list(itertools.product(
+        parse_values(min_relative_bands_delta, config['bollinger']['minRelativeBandsDelta']),
+        parse_values(stop_loss, config['serialTrader']['stopLossPercentage']),
+        parse_values(stop_gain, config['serialTrader']['stopGainPercentage'])))
+    logging.info(f'Start optimizing {len(grid)} parameter combinations')
+
+    exchange = backtest.Backtest(
+        config, config['serialTrader']['baseAsset'], config['serialTrader']['assetToTrade'])
+    klines = indicators.enrich_klines_with_indicators(exchange.historical_data.copy())
+
+    with tempfile.TemporaryDirectory() as directory:
+        klines_filename = os.path.join(directory, 'klines.npy')
+        shared_klines = numpy.lib.format.open_memmap(
+            klines_filename, mode='w+', dtype=numpy.float64, shape=klines.shape)
+        shared_klines[:] = klines.to_numpy(dtype=numpy.float64)
+        shared_klines.flush()
+        del shared_klines
+
+        with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_initialize_worker,
+                initargs=(config, klines_filename, list(klines.columns))) as executor:
+            results = list(executor.map(
+                _run_backtest,
+                itertools.repeat(config), itertools.repeat(trading_strategies_list),
+                itertools.repeat(exchange.tax), grid,
+                chunksize=max(1, len(grid) // (4 * max(max_workers or 1, 1)))))
+
+    results.sort(key=lambda result: result['balance'], reverse=True)
+    report_results(results[:top])
+
+
+def parse_values(values: str, default) -> List[float]:
+    """
+    Parses a list of values (e.g. 1,2,5) or an inclusive range of values in
+    the start:stop:step format (e.g. 1:5:0.5). Returns the default value when
+    no values are given.
+    """
+    if values is None:
+        return [float(default)]
+
+    if ':' in values:
+        start, stop, step = map(float, values.split(':'))
+        if step <= 0:
+            raise ValueError('Invalid range step: %s' % values)
+        # small tolerance so that the stop value is included despite rounding.
+        num_values = int(numpy.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 10) for i in range(max(num_values, 0))]
+
+    return [float(value) for value in values.split(',')]
+
+
+def report_results(results: List[Dict]):
+    header = f'{"rank":>4}  {"minRelativeBandsDelta":>21}  {"stopLoss":>8}  {"stopGain":>8}  {"gains":>6}  {"losses":>6}  {"balance":>10}'
+    click.echo(header)
+    click.echo('-' * len(header))
+    for rank, result in enumerate(results, start=1):
+        click.echo(f'{rank:>4}  ' +
+                   f'{result["minRelativeBandsDelta"]:>21g}  ' +
+                   f'{result["stopLossPercentage"]:>8g}  ' +
+                   f'{result["stopGainPercentage"]:>8g}  ' +
+                   f'{result["gains"]:>6}  ' +
+                   f'{result["losses"]:>6}  ' +
+                   f'{result["balance"]:>10.6f}')
+
+
+# enriched klines of the worker process, mapped from the shared file, and
+# the exit resolver over them.
+_worker_klines = None
+_worker_exit_resolver = None
+
+
+def _initialize_worker(config: Dict, klines_filename: str, columns: List[str]):
+    global _worker_klines, _worker_exit_resolver
+    _worker_klines = pandas.DataFrame(
+        numpy.load(klines_filename, mmap_mode='r'), columns=columns, copy=False)
+    symbol = utils.build_symbol(
+        config['serialTrader']['assetToTrade'], config['serialTrader']['baseAsset'])
+    _worker_exit_resolver = exits.ExitResolver(config, symbol, _worker_klines)
+
+
+def _run_backtest(config: Dict, trading_strategies_list: List[str], tax: float, params) -> Dict:
+    min_relative_bands_delta, stop_loss_percentage, stop_gain_percentage = params
+
+    config = copy.deepcopy(config)
+    config['bollinger']['minRelativeBandsDelta'] = min_relative_bands_delta
+    config['serialTrader']['stopLossPercentage'] = stop_loss_percentage
+    config['serialTrader']['stopGainPercentage'] = stop_gain_percentage
+
+    strategies: List[TradingStrategy] = []
+    if 'bollinger' in trading_strategies_list:
+        strategies.append(bollinger.Bollinger(config))
+    if 'dma' in trading_strategies_list:
+        strategies.append(dma.DualMovingAverage(config))
+
+    results = vectorized_backtest.VectorizedBacktest(
+        config, None, strategies, tax, _worker_exit_resolver).run(_worker_klines)
+
+    return {
+        'minRelativeBandsDelta': min_relative_bands_delta,
+        'stopLossPercentage': stop_loss_percentage,
+        'stopGainPercentage': stop_gain_percentage,
+        'gains': results.gains,
+        'losses': results.losses,
+        'balance': results.balance,
+    }
@@ -1,22 +1,38 @@
 from typing import List, Dict
 
+import os
 import click
+import queue
+import socket
+import asyncio
 import logging
-import time
+import threading
 import traceback
+import numpy
 
 from src.domain.cache import Cache
-from src.domain.exchanges import Exchange
+from src.domain.clocks import Clock
+from src.domain.clocks.live import LiveClock
+from src.domain.entities.market_snapshot import MarketSnapshot
+from src.domain import metrics
+from src.domain.exchanges import AsyncExchange, Exchange, async_wrapper, fake, fetcher
+from src.domain.sharding import LeaderLock, Shard
 from src.domain.trading_strategies import TradingStrategy, period_max
 from src.gateways.redis import redis
-from src.gateways.binance import binance
+from src.gateways.memory import dictionary, memory
+from src.gateways.backtest import portfolio_backtest
+from src.gateways.binance import binance, async_binance
 
 
 @click.command()
-@click.option('--exchange-name', help='Define the exchange to be used. (options: binance)')
+@click.option('--exchange-name', help='Define the exchange to be used. (options: binance|backtest|fake)')
 @click.option('--trading-strategies', help='Define the trading strategies to be used, separated by comma. (options: period-max)')
+@click.option('--streaming', is_flag=True, help='React to streamed price updates instead of polling the exchange every cycle.')
+@click.option('--asynchronous', is_flag=True, help='Run concurrent requests and place orders in parallel using asyncio.')
+@click.option('--sharded', is_flag=True, help='Share the symbols with the other sharded workers using the same Redis.')
+@click.option('--worker-id', help='Define the worker identifier used in sharded mode and to elect the updater leader. (default: hostname-pid)')
 @click.pass_context
-def parallel_trader(ctx, exchange_name, trading_strategies):
+def parallel_trader(ctx, exchange_name, trading_strategies, streaming, asynchronous, sharded, worker_id):
     """
     Parallel Trader is a bot for trading multiple asset pairs at the same time,
     always using the same base asset. It uses multiple trading strategies to
@@ -31,57 +47,181 @@ def parallel_trader(ctx, exchange_name, trading_strategies):
     Bot workflow:
 
         TODO
+
+    With the --streaming flag, the bot doesn't poll the exchange every cycle.
+    Instead, it evaluates the strategies for each price update streamed by
+    the exchange as soon as it arrives. With the --asynchronous flag, the
+    requests of each cycle run concurrently and orders are placed in parallel.
+
+    With the backtest exchange, the bot replays the historical data of all
+    the base asset symbols on a simulated clock, without waiting between
+    cycles, and reports the portfolio results at the end.
+
+    With the --sharded flag, many workers run side by side, each one only
+    scanning its own share of the symbols, as assigned by consistent hashing
+    among the workers alive in Redis. Symbols are claimed in Redis before
+    entering a trade. With Redis, sharded or not, only the elected leader
+    among the replicas updates the PeriodMax cache.
     """
     config = ctx.obj['config']
     base_asset = config['parallelTrader']['baseAsset']
 
+    if streaming and asynchronous:
+        raise ValueError('Streaming and asynchronous modes are mutually exclusive')
+    if exchange_name == 'backtest' and (streaming or asynchronous):
+        raise ValueError('Streaming and asynchronous modes require a live exchange')
+    if exchange_name == 'backtest' and sharded:
+        raise ValueError('Sharded mode requires a live exchange')
+
     # initialize exchange.
     exchange: Exchange = None
+    clock: Clock = LiveClock()
+    concurrent_fetcher: fetcher.ConcurrentFetcher = None
     if exchange_name == 'binance':
         exchange = binance.Binance(config, base_asset)
+    elif exchange_name == 'backtest':
+        exchange = portfolio_backtest.PortfolioBacktest(config, base_asset)
+        clock = exchange.clock
+        # requests to the replayed data don't need to be throttled.
+        concurrent_fetcher = fetcher.ConcurrentFetcher(
+            config, fetcher.UNLIMITED_REQUEST_WEIGHT_PER_MINUTE)
+    elif exchange_name == 'fake':
+        exchange = fake.FakeExchange(config, base_asset)
     else:
         raise ValueError('Invalid exchange name: %s' % exchange_name)
+    exchange = metrics.instrument(config, exchange, 'exchange')
 
     # initialize cache.
-    cache: Cache = redis.Redis(config)
+    cache: Cache = None
+    shared_cache: Cache = None
+    if exchange_name == 'backtest':
+        cache = dictionary.Dictionary(config)
+    else:
+        # Redis round trips are measured apart from the memory cache hits.
+        shared_cache = metrics.instrument(config, redis.Redis(config), 'redis')
+        cache = shared_cache
+        if str(config['memoryCache']['enabled']).lower() == 'true':
+            cache = memory.Memory(config, cache)
+    cache = metrics.instrument(config, cache, 'cache')
+
+    # initialize sharding and leader election, coordinated through the
+    # shared cache, so that only one of the replicas updates the PeriodMax
+    # cache whether they're sharded or not.
+    shard: Shard = None
+    leader_lock: LeaderLock = None
+    if shared_cache is not None:
+        worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        leader_lock = LeaderLock(
+            shared_cache, period_max.LEADER_LOCK_NAME, worker_id,
+            float(config['periodMax']['cacheUpdater']['leaderLockTtlInSeconds']))
+    if sharded:
+        logging.info(f'Start running as sharded worker {worker_id}')
+        shard = Shard(config, shared_cache, worker_id, clock)
 
     # initialize strategies.
     strategies: List[TradingStrategy] = []
     trading_strategies_list = str(trading_strategies).split(',')
     if 'period-max' in trading_strategies_list:
         strategies.append(period_max.PeriodMax(
-            config, exchange, cache, base_asset))
+            config, exchange, cache, base_asset, clock, leader_lock, concurrent_fetcher))
     if len(strategies) == 0:
         raise ValueError('No valid strategy found in: %s' % trading_strategies)
 
     # initialize and run bot.
-    bot = ParallelTrader(config, exchange, strategies)
-    bot.run()
+    metrics.start(config)
+    if asynchronous:
+        async_exchange: AsyncExchange = async_wrapper.AsyncExchangeWrapper(exchange)
+        if exchange_name == 'binance':
+            async_exchange = async_binance.AsyncBinance(exchange)
+        async_exchange = metrics.instrument(config, async_exchange, 'async_exchange')
+        bot = AsyncParallelTrader(config, async_exchange, strategies, shard)
+        asyncio.run(bot.run())
+        return
+
+    bot = ParallelTrader(config, exchange, strategies, clock, shard)
+    if streaming:
+        bot.run_streaming()
+    else:
+        bot.run()
+
+    if exchange_name == 'backtest':
+        logging.warning(f'End of simulation {exchange.get_results()}')
 
 
 class ParallelTrader:
-    def __init__(self, config: Dict, exchange: Exchange, strategies: List[TradingStrategy]):
+    def __init__(self, config: Dict, exchange: Exchange, strategies: List[TradingStrategy], clock: Clock = None, shard: Shard = None):
         self.exchange = exchange
         self.strategies = strategies
+        self.clock = clock or LiveClock()
+        self.shard = shard
 
         botConfig = config['parallelTrader']
-        self.cycle_time_in_seconds = botConfig['cycleTimeInSeconds']
+        self.cycle_time_in_seconds = float(botConfig['cycleTimeInSeconds'])
         self.base_asset = botConfig['baseAsset']
         self.stop_loss_percentage = float(botConfig['stopLossPercentage'])
         self.stop_gain_percentage = float(botConfig['stopGainPercentage'])
         self.base_asset_amount_per_trade = float(
             botConfig['baseAssetAmountPerTrade'])
 
+        self.cycle_duration = metrics.registry.histogram(
+            'trader_cycle_duration_seconds', bot='parallel_trader')
+        self.price_update_duration = metrics.registry.histogram(
+            'trader_price_update_duration_seconds', bot='parallel_trader')
+        self.exceptions = metrics.registry.counter(
+            'trader_exceptions_total', bot='parallel_trader')
+        self.order_requests = metrics.registry.counter(
+            'trader_order_requests_total', bot='parallel_trader')
+        self.strategies_duration = {
+            strategy: metrics.registry.histogram(
+                'strategy_duration_seconds', strategy=type(strategy).__name__)
+            for strategy in strategies
+        }
+
     def run(self):
         logging.info('Start running Parallel Trader bot')
         while True:
             try:
-                self.__run_internal()
+                with self.cycle_duration.time():
+                    self.__run_internal()
             except Exception as e:
+                self.exceptions.inc()
                 logging.error(
                     f'Fail to run Parallel Trader error={e} {traceback.format_exc()}')
                 self.exchange.reset_client()
-            time.sleep(self.cycle_time_in_seconds)
+            if not self.clock.advance(self.cycle_time_in_seconds):
+                break
+
+    def run_streaming(self):
+        """
+        Runs the bot driven by the exchange streams: strategies are evaluated
+        as soon as each price update arrives, while balance and ongoing trades
+        are kept up to date by the user data stream. Every cycle, they are
+        also synchronized with the exchange as a safety net for lost events.
+
+        Stream messages are handled in order by a worker thread, instead of
+        the thread delivering them, so that placing an order doesn't stall the
+        streams, which also report when the buy order is filled.
+        """
+        logging.info('Start running Parallel Trader bot in streaming mode')
+        self.lock = threading.Lock()
+        self.stream_messages = queue.Queue()
+        self.__synchronize_account()
+        threading.Thread(target=self.__handle_stream_messages, daemon=True).start()
+        self.exchange.start_streams(
+            lambda snapshot: self.stream_messages.put((self.__on_prices, snapshot)),
+            lambda event: self.stream_messages.put((self.__on_user_data, event)))
+        try:
+            while True:
+                self.clock.advance(self.cycle_time_in_seconds)
+                try:
+                    self.__synchronize_account()
+                except Exception as e:
+                    self.exceptions.inc()
+                    logging.error(
+                        f'Fail to synchronize Parallel Trader error={e} {traceback.format_exc()}')
+                    self.exchange.reset_client()
+        finally:
+            self.exchange.stop_streams()
 
     def __run_internal(self):
         logging.debug('Running Parallel Trader trading verification')
@@ -92,38 +232,220 @@ class ParallelTrader:
                 f'Skipping trading verification: insufficient {self.base_asset} balance')
             return
 
-        ongoing_trades = self.exchange.get_ongoing_trades()
+        ongoing_trades = set(self.exchange.get_ongoing_trades())
         logging.debug(f'Ongoing trades: {ongoing_trades}')
 
-        current_prices = self.exchange.get_current_prices()
-        for current_price in current_prices:
-            symbol = current_price['symbol']
-            price = float(current_price['price'])
-
-            if not symbol.endswith(self.base_asset):
-                continue
-
-            if symbol in ongoing_trades:
-                continue
-
-            should_place_order = False
-            for strategy in self.strategies:
-                should_place_order = strategy.should_place_order(
-                    None, price, symbol)
-                if should_place_order:
-                    break
+        self.__evaluate_snapshot(
+            self.exchange.get_market_snapshot(), balance, ongoing_trades)
 
-            if should_place_order:
-                logging.debug(
-                    f'Placing order for symbol {symbol} (current price: {price})')
-                self.exchange.place_order(
+    def __evaluate_snapshot(self, snapshot: MarketSnapshot, balance, ongoing_trades):
+        """
+        Places orders for the snapshot symbols as told by the strategies,
+        adding the traded symbols to ongoing_trades, and returns the remaining
+        balance.
+        """
+        tradable_symbols = self.exchange.get_tradable_symbols()
+        orders = self.select_orders(snapshot, balance, ongoing_trades, tradable_symbols)
+        for position, (symbol, price) in enumerate(orders):
+            logging.debug(
+                f'Placing order for symbol {symbol} (current price: {price})')
+            self.order_requests.inc()
+            try:
+                order = self.exchange.place_order(
                     symbol.replace(self.base_asset, ''),
                     self.base_asset_amount_per_trade,
                     self.stop_loss_percentage,
-                    self.stop_gain_percentage)
-                balance -= self.base_asset_amount_per_trade
+                    self.stop_gain_percentage,
+                    current_price=price)
+            except Exception:
+                # the remaining orders are never attempted in this cycle.
+                pending_symbols = [pending_symbol for pending_symbol, _ in orders[position + 1:]]
+                ongoing_trades.difference_update(pending_symbols)
+                self.release_claims(pending_symbols, 'order not attempted')
+                raise
+            if order is None:
+                self.release_claims([symbol], 'order rejected')
+            balance -= self.base_asset_amount_per_trade
+        return balance
+
+    def release_claims(self, symbols: List[str], reason: str):
+        """
+        In sharded mode, releases the claims of the symbols no buy order was
+        placed for, so that the worker owning them may retry without waiting
+        for the claims to expire.
+
+        Claims of orders that failed are kept instead, since the buy order
+        may have been filled before the failure, leaving a position that
+        isn't among the ongoing trades yet.
+        """
+        if self.shard is None:
+            return
+        for symbol in symbols:
+            logging.debug(f'Releasing claim of symbol {symbol}: {reason}')
+            self.shard.release(symbol)
+
+    def select_orders(self, snapshot: MarketSnapshot, balance, ongoing_trades, tradable_symbols):
+        """
+        Returns the (symbol, price) pairs the strategies tell to trade, limited
+        by the available balance, adding their symbols to ongoing_trades.
+        In sharded mode, only the symbols of the worker shard are candidates,
+        and they are only selected once claimed.
+        """
+        if self.shard is not None:
+            self.shard.refresh()
+
+        candidates = snapshot.select(numpy.fromiter(
+            (symbol in tradable_symbols and symbol not in ongoing_trades and
+             (self.shard is None or self.shard.owns(symbol))
+             for symbol in snapshot.symbols),
+            dtype=bool, count=len(snapshot)))
 
+        for strategy in self.strategies:
+            strategy.prepare_cycle(list(candidates.symbols))
+
+        should_place_orders = numpy.zeros(len(candidates), dtype=bool)
+        for strategy in self.strategies:
+            should_place_orders |= self.__evaluate_strategy(strategy, candidates)
+
+        orders = []
+        selected = candidates.select(should_place_orders)
+        for symbol, price in zip(selected.symbols, selected.prices):
             if balance < self.base_asset_amount_per_trade:
                 logging.debug(
                     f'Skipping verification for next currencies: insufficient {self.base_asset} balance')
+                break
+
+            if self.shard is not None and not self.shard.claim(symbol):
+                logging.debug(f'Skipping symbol {symbol}: claimed by another worker')
+                continue
+
+            orders.append((symbol, price))
+            balance -= self.base_asset_amount_per_trade
+            ongoing_trades.add(symbol)
+
+        return orders
+
+    def __evaluate_strategy(self, strategy: TradingStrategy, candidates: MarketSnapshot):
+        """
+        Returns the mask of the candidates the strategy tells to trade,
+        evaluating all of them at once.
+        """
+        with self.strategies_duration[strategy].time():
+            return strategy.should_place_orders(
+                None, candidates.prices, candidates.symbols)
+
+    def __synchronize_account(self):
+        balance = self.exchange.get_base_asset_balance()
+        ongoing_trades = set(self.exchange.get_ongoing_trades())
+        with self.lock:
+            self.balance = balance
+            self.ongoing_trades = ongoing_trades
+
+    def __handle_stream_messages(self):
+        while True:
+            handler, message = self.stream_messages.get()
+            try:
+                handler(message)
+            except Exception as e:
+                self.exceptions.inc()
+                logging.error(
+                    f'Fail to handle stream message error={e} {traceback.format_exc()}')
+
+    def __on_prices(self, snapshot: MarketSnapshot):
+        with self.lock:
+            if self.balance < self.base_asset_amount_per_trade:
                 return
+            try:
+                with self.price_update_duration.time():
+                    self.balance = self.__evaluate_snapshot(
+                        snapshot, self.balance, self.ongoing_trades)
+            except Exception as e:
+                self.exceptions.inc()
+                logging.error(
+                    f'Fail to evaluate prices error={e} {traceback.format_exc()}')
+
+    def __on_user_data(self, event):
+        with self.lock:
+            if event.get('e') == 'outboundAccountPosition':
+                for balance in event['B']:
+                    if balance['a'] == self.base_asset:
+                        self.balance = float(balance['f'])
+
+            # the trade ends when any order of the OCO sell is filled.
+            elif event.get('e') == 'executionReport':
+                if event['S'] == 'SELL' and event['X'] == 'FILLED':
+                    logging.debug(f'Trade finished for symbol {event["s"]}')
+                    self.ongoing_trades.discard(event['s'])
+
+
+class AsyncParallelTrader(ParallelTrader):
+    """
+    AsyncParallelTrader runs the same workflow of the Parallel Trader on top
+    of an AsyncExchange: the account and market requests of each cycle run
+    concurrently, and all orders of a cycle are placed in parallel, so that
+    the sequencing of one symbol doesn't delay the others.
+    """
+
+    def __init__(self, config: Dict, exchange: AsyncExchange, strategies: List[TradingStrategy], shard: Shard = None):
+        super().__init__(config, None, strategies, shard=shard)
+        self.async_exchange = exchange
+
+    async def run(self):
+        logging.info('Start running Parallel Trader bot (asyncio)')
+        await self.async_exchange.connect()
+        try:
+            while True:
+                try:
+                    with self.cycle_duration.time():
+                        await self.__run_internal()
+                except Exception as e:
+                    self.exceptions.inc()
+                    logging.error(
+                        f'Fail to run Parallel Trader error={e} {traceback.format_exc()}')
+                    await self.async_exchange.reset_client()
+                await asyncio.sleep(self.cycle_time_in_seconds)
+        finally:
+            await self.async_exchange.close()
+
+    async def __run_internal(self):
+        logging.debug('Running Parallel Trader trading verification')
+
+        balance, ongoing_trades, snapshot = await asyncio.gather(
+            self.async_exchange.get_base_asset_balance(),
+            self.async_exchange.get_ongoing_trades(),
+            self.async_exchange.get_market_snapshot())
+
+        if balance < self.base_asset_amount_per_trade:
+            logging.debug(
+                f'Skipping trading verification: insufficient {self.base_asset} balance')
+            return
+
+        ongoing_trades = set(ongoing_trades)
+        logging.debug(f'Ongoing trades: {ongoing_trades}')
+
+        # strategies may block on their cache, so they run in a worker thread.
+        orders = await asyncio.to_thread(
+            self.select_orders, snapshot, balance, ongoing_trades,
+            self.async_exchange.get_tradable_symbols())
+
+        results = await asyncio.gather(*[
+            self.__place_order(symbol, price) for symbol, price in orders
+        ], return_exceptions=True)
+        for (symbol, _), result in zip(orders, results):
+            if isinstance(result, Exception):
+                self.exceptions.inc()
+                logging.error(
+                    f'Fail to place order for symbol {symbol} error={result}')
+            elif result is None:
+                self.release_claims([symbol], 'order rejected')
+
+    async def __place_order(self, symbol, price):
+        logging.debug(
+            f'Placing order for symbol {symbol} (current price: {price})')
+        self.order_requests.inc()
+        return await self.async_exchange.place_order(
+            symbol.replace(self.base_asset, ''),
+            self.base_asset_amount_per_trade,
+            self.stop_loss_percentage,
+            self.stop_gain_percentage,
+            current_price=price)
@@ -0,0 +1,58 @@
+import os
+import click
+import socket
+import logging
+
+from src.domain import metrics
+from src.domain.cache import Cache
+from src.domain.exchanges import Exchange, fake
+from src.domain.sharding import LeaderLock
+from src.domain.trading_strategies import period_max
+from src.gateways.redis import redis
+from src.gateways.binance import binance
+
+
+@click.command()
+@click.option('--exchange-name', help='Define the exchange to be used. (options: binance|fake)')
+@click.option('--worker-id', help='Define the identifier used to elect the updater leader. (default: hostname-pid)')
+@click.pass_context
+def period_max_updater(ctx, exchange_name, worker_id):
+    """
+    Period Max Updater keeps the period maxima used by the PeriodMax strategy
+    up to date in Redis, apart from the bots.
+
+    Many replicas of the updater can run for availability: they elect a
+    leader through a lock in Redis, and only the leader queries the exchange
+    and publishes the maxima, so the exchange usage doesn't grow with the
+    number of replicas. Each snapshot of the maxima is published at once,
+    replacing the previous one. When using it, the updater of the bots can be
+    disabled with periodMax.cacheUpdater.enabled.
+    """
+    config = ctx.obj['config']
+    base_asset = config['parallelTrader']['baseAsset']
+
+    # initialize exchange.
+    exchange: Exchange = None
+    if exchange_name == 'binance':
+        exchange = binance.Binance(config, base_asset)
+    elif exchange_name == 'fake':
+        exchange = fake.FakeExchange(config, base_asset)
+    else:
+        raise ValueError('Invalid exchange name: %s' % exchange_name)
+    exchange = metrics.instrument(config, exchange, 'exchange')
+
+    # initialize cache, without the memory cache, since it's only written.
+    cache: Cache = metrics.instrument(config, redis.Redis(config), 'redis')
+
+    # initialize and run updater.
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    logging.info(f'Start running as updater {worker_id}')
+    leader_lock = LeaderLock(
+        cache, period_max.LEADER_LOCK_NAME, worker_id,
+        float(config['periodMax']['cacheUpdater']['leaderLockTtlInSeconds']))
+    metrics.start(config)
+    updater = period_max.PeriodMaxUpdater(config, exchange, cache, leader_lock=leader_lock)
+    try:
+        updater.run()
+    finally:
+        leader_lock.release()
@@ -26,9 +26,13 @@ def entry_point(ctx, log_level, config_file):
 def add_subcommands():
     from . import serial_trader
     from . import parallel_trader
+    from . import optimize
+    from . import period_max_updater
     modules = (
         serial_trader,
         parallel_trader,
+        optimize,
+        period_max_updater,
     )
     for mod in modules:
         for attr in dir(mod):
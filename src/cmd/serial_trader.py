@@ -2,21 +2,33 @@ from typing import List, Dict
 
 import click
 import logging
-import time
+import numpy
 from matplotlib import pyplot as plt
 
+from src.domain import metrics
+from src.domain.clocks import Clock
+from src.domain.clocks.live import LiveClock
 from src.domain.entities import trading_states
-from src.domain.exchanges import Exchange, fake, utils
-from src.domain.trading_strategies import TradingStrategy, bollinger, dma
+from src.domain.exchanges import Exchange, fake, fetcher, utils
+from src.domain.trading_strategies import TradingStrategy, bollinger, dma, indicators
 from src.gateways.binance import binance
-from src.gateways.backtest import backtest
+from src.gateways.backtest import backtest, vectorized_backtest
+
+
+# Binance request weight of the requests made for each asset every cycle: the
+# open orders and the klines, roughly.
+REQUESTS_WEIGHT_PER_ASSET = 4
+
+# Binance request weight of the prices of all symbols, requested once a cycle.
+MARKET_SNAPSHOT_REQUEST_WEIGHT = 4
 
 
 @click.command()
 @click.option('--exchange-name', help='Define the exchange to be used. (options: binance|backtest|fake)')
 @click.option('--trading-strategies', help='Define the trading strategies to be used, separated by comma. (options: bollinger|dma)')
+@click.option('--vectorized', is_flag=True, help='Simulate the whole historical data at once instead of bar by bar. (only for the backtest exchange)')
 @click.pass_context
-def serial_trader(ctx, exchange_name, trading_strategies):
+def serial_trader(ctx, exchange_name, trading_strategies, vectorized):
     """
     Serial Trader is a simple bot for trading serially using multiple trading
     strategies.
@@ -25,6 +37,9 @@ def serial_trader(ctx, exchange_name, trading_strategies):
     bot enters and exits trades serially, i.e. creating only one trade at a
     time.
 
+    Many pairs can be traded by the same bot (see serialTrader.assetsToTrade),
+    each one with its own trading state, sharing the same exchange client.
+
     Bot workflow:
 
         It has only two trading states (Pending and Trading) and the bot keeps
@@ -37,22 +52,42 @@ def serial_trader(ctx, exchange_name, trading_strategies):
 
         * The Trading state means that there is an ongoing trade. When that's
           the case, the bot only waits until the trade finishes.
+
+        Every cycle, the data of all pairs is requested concurrently, their
+        prices are taken from a single market snapshot, and then each pair
+        is evaluated in the configured order.
+
+        When running with the backtest exchange, the --vectorized flag
+        computes the same simulation over the whole historical data at once,
+        which is orders of magnitude faster than replaying it bar by bar.
     """
     config = ctx.obj['config']
 
-    asset_to_trade = config['serialTrader']['assetToTrade']
+    if vectorized and exchange_name != 'backtest':
+        raise ValueError('Vectorized mode requires the backtest exchange')
+
+    assets_to_trade = get_assets_to_trade(config['serialTrader'])
     base_asset = config['serialTrader']['baseAsset']
 
     # initialize exchange.
     exchange: Exchange = None
+    clock: Clock = LiveClock()
+    concurrent_fetcher: fetcher.ConcurrentFetcher = None
     if exchange_name == 'binance':
         exchange = binance.Binance(config, base_asset)
     elif exchange_name == 'backtest':
-        exchange = backtest.Backtest(config, base_asset, asset_to_trade)
+        if len(assets_to_trade) > 1:
+            raise ValueError('The backtest exchange supports a single asset to trade')
+        exchange = backtest.Backtest(config, base_asset, assets_to_trade[0])
+        clock = exchange.clock
+        # requests to the replayed data don't need to be throttled.
+        concurrent_fetcher = fetcher.ConcurrentFetcher(
+            config, fetcher.UNLIMITED_REQUEST_WEIGHT_PER_MINUTE)
     elif exchange_name == 'fake':
         exchange = fake.FakeExchange(config, base_asset)
     else:
         raise ValueError('Invalid exchange name: %s' % exchange_name)
+    exchange = metrics.instrument(config, exchange, 'exchange')
 
     # initialize strategies.
     strategies: List[TradingStrategy] = []
@@ -64,19 +99,31 @@ def serial_trader(ctx, exchange_name, trading_strategies):
     if len(strategies) == 0:
         raise ValueError('No valid strategy found in: %s' % trading_strategies)
 
+    # run the whole simulation at once.
+    if vectorized:
+        results = vectorized_backtest.VectorizedBacktest(
+            config, exchange.historical_data, strategies, exchange.tax, exchange.exit_resolver).run()
+        logging.warning(f'End of simulation {results}')
+        return
+
     # initialize and run bot.
-    bot = SerialTrader(config, exchange, strategies)
+    metrics.start(config)
+    bot = SerialTrader(config, exchange, strategies, clock, concurrent_fetcher)
     bot.run()
 
+    if exchange_name == 'backtest':
+        logging.warning(f'End of simulation {exchange.get_results()}')
+
 
 class SerialTrader:
-    def __init__(self, config: Dict, exchange: Exchange, strategies: List[TradingStrategy]):
+    def __init__(self, config: Dict, exchange: Exchange, strategies: List[TradingStrategy], clock: Clock = None, concurrent_fetcher: fetcher.ConcurrentFetcher = None):
         self.exchange = exchange
         self.strategies = strategies
+        self.clock = clock or LiveClock()
 
         botConfig = config['serialTrader']
-        self.cycle_time_in_seconds = botConfig['cycleTimeInSeconds']
-        self.asset_to_trade = botConfig['assetToTrade']
+        self.cycle_time_in_seconds = float(botConfig['cycleTimeInSeconds'])
+        self.assets_to_trade = get_assets_to_trade(botConfig)
         self.base_asset = botConfig['baseAsset']
         self.plot_results = botConfig['plotResults']
         self.stop_loss_percentage = float(botConfig['stopLossPercentage'])
@@ -84,59 +131,152 @@ class SerialTrader:
         self.base_asset_usage_percentage = float(
             botConfig['baseAssetUsagePercentage'])
 
+        # the requests of all pairs share the same exchange client.
+        self.fetcher = concurrent_fetcher or fetcher.ConcurrentFetcher(config)
+
+        # recent klines of all pairs, whose indicators are computed at once.
+        self.indicators = indicators.IndicatorMatrix(self.assets_to_trade)
+
+        self.cycle_duration = metrics.registry.histogram(
+            'trader_cycle_duration_seconds', bot='serial_trader')
+        self.exceptions = metrics.registry.counter(
+            'trader_exceptions_total', bot='serial_trader')
+        self.order_requests = metrics.registry.counter(
+            'trader_order_requests_total', bot='serial_trader')
+        self.strategies_duration = {
+            strategy: metrics.registry.histogram(
+                'strategy_duration_seconds', strategy=type(strategy).__name__)
+            for strategy in strategies
+        }
+
     def run(self):
-        logging.info('Start running Serial Trader bot')
+        """
+        Runs the bot until its clock stops, which only happens when replaying
+        historical data.
+        """
+        logging.info(f'Start running Serial Trader bot assets={self.assets_to_trade}')
         while True:
             try:
-                self.__run_internal()
+                with self.cycle_duration.time():
+                    self.__run_internal()
             except Exception as e:
+                self.exceptions.inc()
                 logging.error(f'Fail to run Serial Trader error={e}')
                 self.exchange.reset_client()
-            time.sleep(self.cycle_time_in_seconds)
+            if not self.clock.advance(self.cycle_time_in_seconds):
+                break
 
     def __run_internal(self):
         logging.debug('Running Serial Trader trading verification')
 
-        state = self.exchange.get_trading_state(self.asset_to_trade)
-
-        if state == trading_states.PENDING:
-            klines = self.exchange.get_historical_klines(self.asset_to_trade)
-            df = self.__enrich_klines_with_indicators(klines)
-            price = self.exchange.get_current_price(self.asset_to_trade)
-
-            should_place_order = False
-            for strategy in self.strategies:
-                should_place_order = strategy.should_place_order(
-                    df, price, utils.build_symbol(self.asset_to_trade, self.base_asset))
-                if should_place_order:
-                    break
-
-            if should_place_order:
-                base_asset_balance = self.exchange.get_base_asset_balance()
-                base_asset_amount = base_asset_balance * self.base_asset_usage_percentage / 100
-                buy_order, sell_order = self.exchange.place_order(
-                    self.asset_to_trade,
-                    base_asset_amount,
-                    self.stop_loss_percentage,
-                    self.stop_gain_percentage)
-                self.__report_placed_order(buy_order, sell_order, klines)
-
-        elif state == trading_states.TRADING:
-            logging.debug('Waiting order to complete')
+        assets_data, errors = self.fetcher.fetch(
+            self.assets_to_trade, self.__get_asset_data, REQUESTS_WEIGHT_PER_ASSET)
+        for asset_to_trade, e in errors.items():
+            logging.error(f'Fail to get data asset={asset_to_trade} error={e}')
+
+        pending_assets = []
+        for asset_to_trade in self.assets_to_trade:
+            if asset_to_trade not in assets_data:
+                continue
+
+            state, _ = assets_data[asset_to_trade]
+            if state == trading_states.PENDING:
+                pending_assets.append(asset_to_trade)
+            elif state == trading_states.TRADING:
+                logging.debug(f'Waiting order to complete asset={asset_to_trade}')
+
+        if len(pending_assets) == 0:
             return
 
-    def __enrich_klines_with_indicators(self, klines):
-        klines['tp'] = (klines['close'] + klines['low'] + klines['high']) / 3
-        klines['std'] = klines['tp'].rolling(20).std(ddof=0)
-        klines['sma_20'] = klines['tp'].rolling(20).mean()
-        klines['sma_50'] = klines['tp'].rolling(50).mean()
-        klines['sma_200'] = klines['tp'].rolling(200).mean()
-        klines['bollinger_low'] = klines['sma_20'] - 2*klines['std']
-        klines['bollinger_up'] = klines['sma_20'] + 2*klines['std']
-        return klines
+        # the prices of all pairs are taken from a single snapshot.
+        self.fetcher.rate_limiter.acquire(MARKET_SNAPSHOT_REQUEST_WEIGHT)
+        snapshot = self.exchange.get_market_snapshot()
+
+        priced_assets = []
+        prices = []
+        for asset_to_trade in pending_assets:
+            price = snapshot.get_price(utils.build_symbol(asset_to_trade, self.base_asset))
+            if price is None:
+                logging.error(f'Fail to get current price asset={asset_to_trade}')
+                continue
+            self.indicators.update_from_klines(asset_to_trade, assets_data[asset_to_trade][1])
+            priced_assets.append(asset_to_trade)
+            prices.append(price)
+
+        if len(priced_assets) == 0:
+            return
+
+        prices = numpy.array(prices, dtype=numpy.float64)
+        should_place_orders = self.__evaluate_strategies(priced_assets, prices)
+
+        # pairs are traded in the configured order, so that their priority
+        # over the available balance is predictable. A failure placing the
+        # order of a pair doesn't prevent the others from being traded.
+        for asset_to_trade, price, should_place_order in zip(priced_assets, prices, should_place_orders):
+            if not should_place_order:
+                continue
+            try:
+                self.__place_order(asset_to_trade, float(price), assets_data[asset_to_trade][1])
+            except Exception as e:
+                self.exceptions.inc()
+                logging.error(f'Fail to place order asset={asset_to_trade} error={e}')
+
+    def __get_asset_data(self, asset_to_trade):
+        """
+        Returns the trading state of the given asset and, when there isn't an
+        ongoing trade, its recent klines.
+        """
+        state = self.exchange.get_trading_state(asset_to_trade)
+        if state != trading_states.PENDING:
+            return state, None
+
+        klines = self.exchange.get_historical_klines(asset_to_trade)
+        return state, klines
+
+    def __evaluate_strategies(self, assets_to_trade, prices):
+        """
+        Returns the mask of the given assets any strategy tells to trade,
+        evaluating all of them at once.
+        """
+        latest = self.indicators.latest(assets_to_trade)
+        symbols = numpy.array([utils.build_symbol(asset_to_trade, self.base_asset)
+                               for asset_to_trade in assets_to_trade], dtype=object)
+
+        should_place_orders = numpy.zeros(len(assets_to_trade), dtype=bool)
+        for strategy in self.strategies:
+            with self.strategies_duration[strategy].time():
+                should_place_orders |= strategy.should_place_orders(latest, prices, symbols)
+        return should_place_orders
+
+    def __place_order(self, asset_to_trade, price, klines):
+        base_asset_balance = self.exchange.get_base_asset_balance()
+        base_asset_amount = base_asset_balance * self.base_asset_usage_percentage / 100
+        self.order_requests.inc()
+        buy_order, sell_order = self.exchange.place_order(
+            asset_to_trade,
+            base_asset_amount,
+            self.stop_loss_percentage,
+            self.stop_gain_percentage,
+            current_price=price)
+        self.__report_placed_order(buy_order, sell_order, klines)
 
     def __report_placed_order(self, buy_order, sell_order, klines):
         if self.plot_results:
+            klines = indicators.enrich_klines_with_indicators(klines)
             # mplfinance.plot(klines[['open', 'high', 'low', 'close', 'volume']], type='candle', ax=ax)
             plt.plot(klines[['close', 'bollinger_low', 'bollinger_up']])
             plt.show()
+
+
+def get_assets_to_trade(botConfig) -> List[str]:
+    """
+    Returns the assets traded by the bot, taken from assetsToTrade, either a
+    list or a comma separated string, or from assetToTrade when it's empty.
+    """
+    assets_to_trade = botConfig.get('assetsToTrade') or []
+    if isinstance(assets_to_trade, str):
+        assets_to_trade = assets_to_trade.split(',')
+    assets_to_trade = [asset.strip() for asset in assets_to_trade if asset.strip()]
+    if len(assets_to_trade) == 0:
+        assets_to_trade = [botConfig['assetToTrade']]
+    return assets_to_trade
@@ -1,4 +1,12 @@
-from typing import Dict
+from typing import Dict, List
+
+
+def build_generation_key(name: str) -> str:
+    """
+    Returns the key of the counter incremented whenever the hash with the
+    given name is written, so that readers can tell their copy is outdated.
+    """
+    return f'{name}:generation'
 
 
 class Cache:
@@ -10,7 +18,51 @@ class Cache:
         pass
 
     def hset(self, name: str, mapping: Dict):
+        """
+        Sets all the given fields of the hash at once.
+        """
+        pass
+
+    def hreplace(self, name: str, mapping: Dict) -> int:
+        """
+        Replaces the whole hash with the given fields at once, so that readers
+        never see it half-written, and increments the hash generation.
+        Returns the new generation.
+        """
         pass
 
     def hget(self, name: str, key: str) -> str:
         pass
+
+    def hmget(self, name: str, keys: List[str]) -> List[str]:
+        """
+        Returns the values of the given fields of the hash at once, using None
+        for the missing ones.
+        """
+        pass
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        pass
+
+    def hdel(self, name: str, keys: List[str]):
+        pass
+
+    def get(self, name: str) -> str:
+        pass
+
+    def incr(self, name: str) -> int:
+        pass
+
+    def acquire_lock(self, name: str, owner: str, ttl_in_seconds: float) -> bool:
+        """
+        Acquires the lock with the given name for the owner, or renews it when
+        the owner already holds it. Returns whether the owner holds the lock,
+        which expires after the given TTL unless renewed.
+        """
+        pass
+
+    def release_lock(self, name: str, owner: str):
+        """
+        Releases the lock with the given name, only if held by the owner.
+        """
+        pass
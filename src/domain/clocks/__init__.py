@@ -0,0 +1,28 @@
+from typing import Callable
+
+
+class Clock:
+    """
+    Clock is an interface that defines how bots perceive and let time pass, so
+    that the same bot can either run live or replay historical data.
+    """
+
+    def now(self) -> float:
+        """
+        Returns the current time as a Unix timestamp in seconds.
+        """
+        pass
+
+    def advance(self, seconds: float) -> bool:
+        """
+        Lets the given amount of time pass. Returns False when there is no
+        more time to pass, i.e. when a simulation is over.
+        """
+        pass
+
+    def call_every(self, seconds: float, function: Callable):
+        """
+        Calls the given function right away and then every given amount of
+        seconds, in background.
+        """
+        pass
@@ -0,0 +1,28 @@
+from typing import Callable
+
+import time
+import threading
+
+from . import Clock
+
+
+class LiveClock(Clock):
+    """
+    LiveClock follows the wall clock, sleeping whenever it's told to advance.
+    """
+
+    def now(self) -> float:
+        return time.time()
+
+    def advance(self, seconds: float) -> bool:
+        time.sleep(seconds)
+        return True
+
+    def call_every(self, seconds: float, function: Callable):
+        # daemon threads don't keep the process alive once the bot stops.
+        def run():
+            while True:
+                function()
+                time.sleep(seconds)
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,50 @@
+from typing import Callable, List
+
+import numpy
+
+from . import Clock
+
+
+class SimulatedClock(Clock):
+    """
+    SimulatedClock steps through the open times of historical bars. Advancing
+    it jumps straight to the first bar at or after the requested time, without
+    sleeping, so that simulations run as fast as the CPU allows.
+
+    The on_advance callback is called with the previous and the new bar
+    indexes whenever the clock advances, so that the owner of the historical
+    data can process everything that happened in between.
+    """
+
+    def __init__(self, times_in_seconds, on_advance: Callable = None, start_index: int = 0):
+        self.times_in_seconds = numpy.asarray(times_in_seconds, dtype=numpy.float64)
+        self.on_advance = on_advance
+        self.index = start_index
+        self.scheduled: List[list] = []  # [next_call_time, interval, function]
+
+    def now(self) -> float:
+        return float(self.times_in_seconds[self.index])
+
+    def advance(self, seconds: float) -> bool:
+        target = self.now() + seconds
+        index = max(self.index + 1, int(numpy.searchsorted(
+            self.times_in_seconds, target, side='left')))
+        if index >= len(self.times_in_seconds):
+            return False
+
+        previous_index, self.index = self.index, index
+        if self.on_advance is not None:
+            self.on_advance(previous_index, index)
+
+        now = self.now()
+        for scheduled in self.scheduled:
+            if scheduled[0] > now:
+                continue
+            scheduled[2]()
+            while scheduled[0] <= now:
+                scheduled[0] += scheduled[1]
+        return True
+
+    def call_every(self, seconds: float, function: Callable):
+        function()
+        self.scheduled.append([self.now() + seconds, seconds, function])
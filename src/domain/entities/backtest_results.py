@@ -0,0 +1,21 @@
+class BacktestResults():
+    """
+    BacktestResults holds the outcome of a simulation. The balance only
+    accounts for finished trades, while the equity also includes the trades
+    still open at the end, valued at their last prices.
+    """
+
+    def __init__(self, gains: int, losses: int, balance: float, initial_balance: float = 1.0, open_positions: int = 0, equity: float = None):
+        self.gains = gains
+        self.losses = losses
+        self.balance = balance
+        self.initial_balance = initial_balance
+        self.open_positions = open_positions
+        self.equity = balance if equity is None else equity
+
+    def __str__(self):
+        return (f'losses={self.losses} ' +
+                f'gains={self.gains} ' +
+                f'balance={self.balance} ' +
+                f'open_positions={self.open_positions} ' +
+                f'equity={self.equity}')
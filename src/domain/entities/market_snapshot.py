@@ -0,0 +1,76 @@
+import threading
+from typing import Dict, List
+
+import numpy
+
+
+class SymbolIndex():
+    """
+    SymbolIndex assigns a stable position to each symbol, in order of first
+    appearance, so that arrays of different snapshots can be aligned.
+    """
+
+    def __init__(self):
+        self.positions: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get_positions(self, symbols) -> numpy.ndarray:
+        with self.lock:
+            for symbol in symbols:
+                if symbol not in self.positions:
+                    self.positions[symbol] = len(self.positions)
+            return numpy.fromiter((self.positions[symbol] for symbol in symbols),
+                                  dtype=numpy.int64, count=len(symbols))
+
+
+class MarketSnapshot():
+    """
+    MarketSnapshot holds the prices of many symbols at a given moment, both as
+    a symbol to price dict and as NumPy arrays, where symbols, prices and
+    positions in the stable symbol index are aligned to each other.
+    """
+
+    def __init__(self, symbols, prices, symbol_index: SymbolIndex, positions=None):
+        self.symbols = numpy.asarray(symbols, dtype=object)
+        self.prices = numpy.asarray(prices, dtype=numpy.float64)
+        self.symbol_index = symbol_index
+        self.positions = positions
+        if self.positions is None:
+            self.positions = symbol_index.get_positions(self.symbols)
+        self.price_by_symbol = dict(zip(self.symbols, self.prices))
+
+    @classmethod
+    def from_prices(cls, prices: List[Dict], symbol_index: SymbolIndex):
+        """
+        Builds a snapshot from prices in the format returned by
+        Exchange.get_current_prices.
+        """
+        symbols = [price['symbol'] for price in prices]
+        values = numpy.fromiter((float(price['price']) for price in prices),
+                                dtype=numpy.float64, count=len(prices))
+        return cls(symbols, values, symbol_index)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def get_price(self, symbol: str) -> float:
+        return self.price_by_symbol.get(symbol)
+
+    def select(self, mask) -> 'MarketSnapshot':
+        """
+        Returns a snapshot with only the symbols selected by the boolean mask.
+        """
+        return MarketSnapshot(self.symbols[mask], self.prices[mask],
+                              self.symbol_index, self.positions[mask])
+
+    def get_aligned_prices(self) -> numpy.ndarray:
+        """
+        Returns the prices aligned to the symbol index positions, with NaN for
+        the symbols not in the snapshot.
+        """
+        aligned_prices = numpy.full(len(self.symbol_index), numpy.nan)
+        aligned_prices[self.positions] = self.prices
+        return aligned_prices
@@ -1,6 +1,8 @@
-from typing import Dict
+from typing import Callable, Dict, Set
 from pandas.core.frame import DataFrame
 
+from src.domain.entities.market_snapshot import MarketSnapshot
+
 
 class Exchange:
     """
@@ -36,11 +38,75 @@ class Exchange:
     def get_current_prices(self):
         pass
 
+    def get_market_snapshot(self) -> MarketSnapshot:
+        """
+        Returns the current prices of all symbols in a single snapshot, which
+        should be fetched once and shared by everyone in a trading cycle.
+        """
+        pass
+
     def get_historical_klines(self, asset_to_trade: str, **kwargs) -> DataFrame:
         pass
 
     def get_klines(self, symbol: str, interval: str, limit: int = 1) -> Dict:
         pass
 
+    def get_tradable_symbols(self) -> Set[str]:
+        """
+        Returns the symbols that can currently be traded against the base
+        asset, using only locally available data.
+        """
+        pass
+
     def reset_client(self):
         pass
+
+    def start_streams(self, on_prices: Callable, on_user_data: Callable):
+        """
+        Starts streaming market and user data in background. on_prices is
+        called with a MarketSnapshot of the updated symbols for every
+        all-market ticker update, and
+        on_user_data is called with every user data event (e.g. order
+        execution reports and account balance updates) in the Binance format.
+        """
+        pass
+
+    def stop_streams(self):
+        pass
+
+
+class AsyncExchange:
+    """
+    AsyncExchange is the asyncio-native counterpart of the Exchange interface,
+    so that independent requests to the exchange can run concurrently.
+    """
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get_ongoing_trades(self):
+        pass
+
+    async def get_base_asset_balance(self) -> float:
+        pass
+
+    async def place_order(self, asset_to_trade: str, **kwargs):
+        pass
+
+    async def get_current_prices(self):
+        pass
+
+    async def get_market_snapshot(self) -> MarketSnapshot:
+        pass
+
+    async def get_klines(self, symbol: str, interval: str, limit: int = 1) -> Dict:
+        pass
+
+    def get_tradable_symbols(self) -> Set[str]:
+        pass
+
+    async def reset_client(self):
+        pass
@@ -0,0 +1,46 @@
+import asyncio
+from typing import Dict, Set
+
+from src.domain.entities.market_snapshot import MarketSnapshot
+
+from . import AsyncExchange, Exchange
+
+
+class AsyncExchangeWrapper(AsyncExchange):
+    """
+    AsyncExchangeWrapper adapts any blocking Exchange to the AsyncExchange
+    interface by running each call in a worker thread.
+    """
+
+    def __init__(self, exchange: Exchange):
+        self.exchange = exchange
+
+    async def get_ongoing_trades(self):
+        return await asyncio.to_thread(self.exchange.get_ongoing_trades)
+
+    async def get_base_asset_balance(self) -> float:
+        return await asyncio.to_thread(self.exchange.get_base_asset_balance)
+
+    async def place_order(self, asset_to_trade: str, base_asset_amount, stop_loss_percentage, stop_gain_percentage, current_price: float = None):
+        return await asyncio.to_thread(
+            self.exchange.place_order,
+            asset_to_trade,
+            base_asset_amount,
+            stop_loss_percentage,
+            stop_gain_percentage,
+            current_price)
+
+    async def get_current_prices(self):
+        return await asyncio.to_thread(self.exchange.get_current_prices)
+
+    async def get_market_snapshot(self) -> MarketSnapshot:
+        return await asyncio.to_thread(self.exchange.get_market_snapshot)
+
+    async def get_klines(self, symbol: str, interval: str, limit: int = 1) -> Dict:
+        return await asyncio.to_thread(self.exchange.get_klines, symbol, interval, limit)
+
+    def get_tradable_symbols(self) -> Set[str]:
+        return self.exchange.get_tradable_symbols()
+
+    async def reset_client(self):
+        await asyncio.to_thread(self.exchange.reset_client)
@@ -1,14 +1,20 @@
-from typing import Dict
+from typing import Dict, Set
+import queue
+import threading
+
 from . import Exchange
 from . import utils
 
 from src.domain.entities import trading_states
+from src.domain.entities.market_snapshot import MarketSnapshot, SymbolIndex
 
 
 class FakeExchange(Exchange):
     def __init__(self, config, base_asset):
         self.base_asset = base_asset
-        pass
+        self.user_data_events = queue.Queue()
+        self.streams_stopped = None
+        self.symbol_index = SymbolIndex()
 
     def get_market_depth(self, asset_to_trade: str):
         return {
@@ -37,7 +43,14 @@ class FakeExchange(Exchange):
         # }
         return 136.76918981
 
-    def place_order(self, asset_to_trade: str, base_asset_usage_percentage, stop_loss_percentage, stop_gain_percentage):
+    def place_order(self, asset_to_trade: str, base_asset_usage_percentage, stop_loss_percentage, stop_gain_percentage, current_price: float = None):
+        if self.streams_stopped is not None:
+            self.user_data_events.put({
+                'e': 'executionReport',
+                's': utils.build_symbol(asset_to_trade, self.base_asset),
+                'S': 'BUY',
+                'X': 'FILLED',
+            })
         return {
             'symbol': 'ADAUSDT',
             'orderId': 1487106018,
@@ -74,6 +87,9 @@ class FakeExchange(Exchange):
             }
         ]
 
+    def get_market_snapshot(self) -> MarketSnapshot:
+        return MarketSnapshot.from_prices(self.get_current_prices(), self.symbol_index)
+
     def get_historical_klines(self, asset_to_trade: str, **kwargs):
         raw_klines = [
             [
@@ -137,5 +153,30 @@ class FakeExchange(Exchange):
             ]
         ]
 
+    def get_tradable_symbols(self) -> Set[str]:
+        return {utils.build_symbol('ADA', self.base_asset)}
+
     def reset_client(self):
         pass
+
+    def start_streams(self, on_prices, on_user_data):
+        """
+        Replays the fake prices every second, along with the user data events
+        generated by the placed orders, in a background thread.
+        """
+        self.streams_stopped = threading.Event()
+
+        def replay(streams_stopped):
+            while not streams_stopped.is_set():
+                while not self.user_data_events.empty():
+                    on_user_data(self.user_data_events.get())
+                on_prices(self.get_market_snapshot())
+                streams_stopped.wait(1)
+
+        threading.Thread(target=replay, args=(self.streams_stopped,), daemon=True).start()
+
+    def stop_streams(self):
+        if self.streams_stopped is not None:
+            self.streams_stopped.set()
+            self.streams_stopped = None
+        self.symbol_index = SymbolIndex()
@@ -0,0 +1,109 @@
+from typing import Callable, Dict, Iterable, Tuple
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# request weight limit that never throttles requests, e.g. to replayed data.
+UNLIMITED_REQUEST_WEIGHT_PER_MINUTE = 1e12
+
+# seconds of the request weight limit that may be spent at once, e.g. by all
+# the requests of a cycle, which adds at most a sixth of the limit to the
+# weight spent in any minute.
+BURST_IN_SECONDS = 10
+
+
+class RateLimiter():
+    """
+    RateLimiter is a thread-safe token bucket. Tokens are refilled at a
+    constant rate up to the bucket capacity, and each request consumes as many
+    tokens as its weight, waiting for them when needed. Requests heavier than
+    the capacity wait for a full bucket and leave it in debt.
+    """
+
+    def __init__(self, tokens_per_second: float, capacity: float):
+        self.tokens_per_second = tokens_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, weight: float = 1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.tokens_per_second)
+                self.updated_at = now
+
+                required_tokens = min(weight, self.capacity)
+                if self.tokens >= required_tokens:
+                    self.tokens -= weight
+                    return
+                wait_in_seconds = (required_tokens - self.tokens) / self.tokens_per_second
+
+            time.sleep(wait_in_seconds)
+
+
+class ConcurrentFetcher():
+    """
+    ConcurrentFetcher runs one request per key in a fixed pool of workers,
+    throttled by a token bucket tuned to the exchange request weight limit.
+
+    Failed requests are retried with exponential backoff, and each key reports
+    its own result or error, so that a bad key doesn't abort the others.
+
+    The request weight limit is taken from the config, unless another one is
+    given, such as UNLIMITED_REQUEST_WEIGHT_PER_MINUTE. The bucket holds
+    BURST_IN_SECONDS of it, so that the requests of a cycle aren't throttled
+    as long as the limit isn't exceeded over time.
+    """
+
+    def __init__(self, config: Dict, request_weight_per_minute: float = None):
+        fetcherConfig = config['fetcher']
+        self.max_retries = int(fetcherConfig['maxRetries'])
+        self.retry_backoff_in_seconds = float(fetcherConfig['retryBackoffInSeconds'])
+
+        max_workers = int(fetcherConfig['maxWorkers'])
+        if request_weight_per_minute is None:
+            request_weight_per_minute = float(fetcherConfig['requestWeightPerMinute'])
+        self.rate_limiter = RateLimiter(
+            request_weight_per_minute / 60.0,
+            max(request_weight_per_minute / 60.0 * BURST_IN_SECONDS, 1))
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='fetcher')
+
+    def fetch(self, keys: Iterable, fetch_function: Callable, weight: float = 1) -> Tuple[Dict, Dict]:
+        """
+        Calls fetch_function for every key concurrently and returns two dicts:
+        the results of the successful keys and the errors of the failed ones.
+        """
+        futures = {key: self.executor.submit(self.__fetch_with_retries, key, fetch_function, weight)
+                   for key in keys}
+
+        results = {}
+        errors = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                errors[key] = e
+        return results, errors
+
+    def __fetch_with_retries(self, key, fetch_function: Callable, weight: float):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(weight)
+            try:
+                return fetch_function(key)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                backoff_in_seconds = self.retry_backoff_in_seconds * 2**attempt
+                logging.debug(f'Retrying fetch key={key} attempt={attempt+1} ' +
+                              f'backoff={backoff_in_seconds}s error={e}')
+                time.sleep(backoff_in_seconds)
+                attempt += 1
@@ -1,50 +1,65 @@
 import numpy
 import pandas
+from decimal import Decimal, ROUND_DOWN
 
 
-def parse_klines(raw_klines):
-    klines = pandas.DataFrame(raw_klines, columns='''
-            open_time
-            open
-            high
-            low
-            close
-            volume
-            close_time
-            quote_volume
-            number_of_trades
-            taker_buy_base_volume
-            taker_buy_quote_volume
-            can_be_ignored
-        '''.split(), dtype=numpy.float64)
-
-    klines['time'] = pandas.to_datetime(
-        klines['open_time'].apply(lambda x: int(x)),
-        unit='ms')
-    klines = klines.set_index('time')
+# columns of the raw klines returned by the Binance API, in their order.
+KLINE_COLUMNS = (
+    'open_time',
+    'open',
+    'high',
+    'low',
+    'close',
+    'volume',
+    'close_time',
+    'quote_volume',
+    'number_of_trades',
+    'taker_buy_base_volume',
+    'taker_buy_quote_volume',
+    'can_be_ignored',
+)
+
+# columns actually used by the trading strategies.
+OHLCV_COLUMNS = KLINE_COLUMNS[:6]
+
+
+def parse_klines_columns(raw_klines, columns=KLINE_COLUMNS):
+    """
+    Parses raw klines into one float64 NumPy array per requested column,
+    converting each column in a single pass and skipping the other ones.
+    """
+    parsed = {}
+    for column in columns:
+        position = KLINE_COLUMNS.index(column)
+        parsed[column] = numpy.array(
+            [kline[position] for kline in raw_klines], dtype=numpy.float64)
+    return parsed
+
+
+def parse_klines(raw_klines, columns=KLINE_COLUMNS):
+    """
+    Parses raw klines into a DataFrame indexed by their open time. Use
+    columns=OHLCV_COLUMNS to keep only the columns used by the strategies.
+    """
+    klines = pandas.DataFrame(parse_klines_columns(raw_klines, columns))
+
+    open_times = numpy.array([kline[0] for kline in raw_klines], dtype=numpy.int64)
+    klines.index = pandas.to_datetime(open_times, unit='ms')
+    klines.index.name = 'time'
 
     return klines
 
 
 def fix_asset_precision(asset, precision: int = 8):
-    fixed_asset = ''
-    digit_count = 0
-    dot_found = False
-    for char in str(asset):
-        if char == '.':
-            dot_found = True
-            if dot_found and digit_count >= precision:
-                break
-            fixed_asset += char
-        else:
-            if digit_count >= precision:
-                if dot_found:
-                    break
-                fixed_asset += '0'
-            else:
-                fixed_asset += char
-            digit_count += 1
-    return fixed_asset
+    """
+    Truncates the asset to its first precision digits, counting the digits of
+    both its integer and fractional parts, and returns it as a string.
+    """
+    value = Decimal(str(asset))
+    integer_digits = len(str(int(abs(value))))
+    exponent = integer_digits - precision
+    fixed_asset = value.scaleb(-exponent).to_integral_value(ROUND_DOWN).scaleb(exponent)
+    return format(fixed_asset, 'f')
 
 
 def build_symbol(asset_to_trade: str, base_asset: str):
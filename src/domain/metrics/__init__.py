@@ -0,0 +1,281 @@
+from typing import Dict
+
+import time
+import bisect
+import inspect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# upper bounds of the latency histograms buckets, in seconds.
+DEFAULT_BUCKETS_IN_SECONDS = (
+    0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+
+class Histogram():
+    """
+    Histogram counts the observed values in cumulative buckets, as Prometheus
+    does, along with their count, sum and maximum.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_IN_SECONDS):
+        self.lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.bucket_counts[position] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def time(self) -> 'Timer':
+        return Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns the upper bound of the bucket where the given quantile falls,
+        or the maximum for the last bucket.
+        """
+        with self.lock:
+            rank = q * self.count
+            cumulative_count = 0
+            for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+                cumulative_count += bucket_count
+                if cumulative_count >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+
+class Timer():
+    """
+    Timer observes the duration of its context in the given histogram.
+    """
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry():
+    """
+    Registry holds all the metrics of the process, identified by name and
+    labels, and exposes them in the Prometheus text format or as a summary.
+
+    Metrics should be looked up once and kept by whoever updates them, since
+    updating a metric is cheap, but looking it up isn't as much.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[tuple, Counter] = {}
+        self.histograms: Dict[tuple, Histogram] = {}
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self.__get_or_create(self.counters, Counter, name, labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self.__get_or_create(self.histograms, Histogram, name, labels)
+
+    def time(self, name: str, **labels) -> Timer:
+        return self.histogram(name, **labels).time()
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        previous_name = None
+        for (name, labels), counter in counters:
+            if name != previous_name:
+                lines.append(f'# TYPE {name} counter')
+                previous_name = name
+            lines.append(f'{name}{format_labels(labels)} {counter.value}')
+
+        for (name, labels), histogram in histograms:
+            if name != previous_name:
+                lines.append(f'# TYPE {name} histogram')
+                previous_name = name
+            with histogram.lock:
+                bucket_counts = list(histogram.bucket_counts)
+                count, total = histogram.count, histogram.sum
+            cumulative_count = 0
+            for bound, bucket_count in zip(histogram.buckets + ('+Inf',), bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative_count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """
+        Returns a human readable summary of all metrics, one per line, with
+        the durations in milliseconds.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        for (name, labels), counter in counters:
+            lines.append(f'{name}{format_labels(labels)} {counter.value}')
+        for (name, labels), histogram in histograms:
+            if histogram.count == 0:
+                continue
+            lines.append(f'{name}{format_labels(labels)} ' +
+                         f'count={histogram.count} ' +
+                         f'mean={histogram.sum / histogram.count * 1000:.2f}ms ' +
+                         f'p50<={histogram.quantile(0.5) * 1000:.2f}ms ' +
+                         f'p99<={histogram.quantile(0.99) * 1000:.2f}ms ' +
+                         f'max={histogram.max * 1000:.2f}ms')
+        return '\n'.join(lines)
+
+    def __get_or_create(self, metrics: Dict, metric_class, name: str, labels: Dict):
+        key = (name, tuple(sorted(labels.items())))
+        metric = metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = metrics.setdefault(key, metric_class())
+        return metric
+
+
+def format_labels(labels) -> str:
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+# metrics of the whole process.
+registry = Registry()
+
+
+class Instrumented():
+    """
+    Instrumented wraps any object, such as an Exchange or a Cache, timing each
+    call to its public methods and counting the ones that fail, labelled by
+    method. Coroutine methods are timed until they're done.
+    """
+
+    def __init__(self, target, component: str, registry: Registry = registry):
+        self.__dict__['_target'] = target
+        self.__dict__['_component'] = component
+        self.__dict__['_registry'] = registry
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        histogram = self._registry.histogram(
+            f'{self._component}_call_duration_seconds', method=name)
+        errors = self._registry.counter(
+            f'{self._component}_call_errors_total', method=name)
+
+        if inspect.iscoroutinefunction(attribute):
+            async def call(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await attribute(*args, **kwargs)
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+        else:
+            def call(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return attribute(*args, **kwargs)
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+
+        # the wrapper is kept, so that it's only built on the first call.
+        self.__dict__[name] = call
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+def instrument(config, target, component: str):
+    """
+    Returns the target instrumented as the given component, or the target
+    itself when metrics are disabled.
+    """
+    if str(config['metrics']['enabled']).lower() != 'true':
+        return target
+    return Instrumented(target, component)
+
+
+def start(config):
+    """
+    Starts exposing the metrics as configured: in the Prometheus text format
+    through HTTP, and as a summary logged periodically.
+    """
+    metricsConfig = config['metrics']
+    if str(metricsConfig['enabled']).lower() != 'true':
+        return
+
+    port = int(metricsConfig['port'] or 0)
+    if port > 0:
+        server = ThreadingHTTPServer(('', port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f'Start serving metrics port={port}')
+
+    summary_interval_in_seconds = float(metricsConfig['summaryIntervalInSeconds'] or 0)
+    if summary_interval_in_seconds > 0:
+        def log_summary():
+            while True:
+                time.sleep(summary_interval_in_seconds)
+                logging.info(f'Metrics summary\n{registry.summary()}')
+
+        threading.Thread(target=log_summary, daemon=True).start()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f'Metrics request {format % args}')
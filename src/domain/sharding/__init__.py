@@ -0,0 +1,131 @@
+import bisect
+import hashlib
+import logging
+
+from src.domain.cache import Cache
+from src.domain.clocks import Clock
+from src.domain.clocks.live import LiveClock
+
+
+def stable_hash(key: str) -> int:
+    """
+    Returns a hash of the key that is the same in every process, unlike the
+    builtin hash of strings, which is randomized per process.
+    """
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing():
+    """
+    HashRing assigns keys to nodes by consistent hashing. Each node is placed
+    many times on the ring, as virtual nodes, so that keys are evenly spread
+    and only the keys of a node that joins or leaves are moved.
+    """
+
+    def __init__(self, nodes, virtual_nodes: int = 64):
+        points = sorted((stable_hash(f'{node}#{i}'), node)
+                        for node in nodes for i in range(virtual_nodes))
+        self.hashes = [point_hash for point_hash, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def get_node(self, key: str):
+        if len(self.nodes) == 0:
+            return None
+        position = bisect.bisect(self.hashes, stable_hash(key)) % len(self.hashes)
+        return self.nodes[position]
+
+
+class Shard():
+    """
+    Shard is the part of the symbols a worker is responsible for, among all
+    the workers sharing the same cache.
+
+    Workers announce themselves with a heartbeat in the cache, and each of
+    them builds the same hash ring out of the workers seen alive. Since two
+    workers may briefly disagree on the ring while a worker joins or leaves,
+    a symbol must also be claimed in the cache before entering a trade.
+    """
+
+    WORKERS_KEY_NAME = 'parallel-trader-workers'
+    CLAIM_KEY_PREFIX = 'parallel-trader-claim'
+
+    def __init__(self, config, cache: Cache, worker_id: str, clock: Clock = None):
+        self.cache = cache
+        self.worker_id = worker_id
+        self.clock = clock or LiveClock()
+
+        shardingConfig = config['parallelTrader']['sharding']
+        self.worker_ttl_in_seconds = float(shardingConfig['workerTtlInSeconds'])
+        self.heartbeat_interval_in_seconds = float(shardingConfig['heartbeatIntervalInSeconds'])
+        self.virtual_nodes_per_worker = int(shardingConfig['virtualNodesPerWorker'])
+        self.claim_ttl_in_seconds = float(shardingConfig['claimTtlInSeconds'])
+
+        self.workers = []
+        self.ring = HashRing([worker_id], self.virtual_nodes_per_worker)
+        self.refreshed_at = None
+
+    def refresh(self):
+        """
+        Sends the worker heartbeat and rebuilds the ring with the workers
+        alive, at most once per heartbeat interval. Workers whose heartbeat
+        expired are removed from the cache.
+        """
+        now = self.clock.now()
+        if self.refreshed_at is not None and \
+                now - self.refreshed_at < self.heartbeat_interval_in_seconds:
+            return
+        self.refreshed_at = now
+
+        self.cache.hset(self.WORKERS_KEY_NAME, {self.worker_id: now})
+        heartbeats = self.cache.hgetall(self.WORKERS_KEY_NAME)
+
+        expired_workers = [worker for worker, heartbeat in heartbeats.items()
+                           if now - float(heartbeat) > self.worker_ttl_in_seconds]
+        self.cache.hdel(self.WORKERS_KEY_NAME, expired_workers)
+
+        workers = sorted(set(heartbeats) - set(expired_workers) | {self.worker_id})
+        if workers != self.workers:
+            logging.info(f'Sharding symbols among workers={workers}')
+            self.workers = workers
+            self.ring = HashRing(workers, self.virtual_nodes_per_worker)
+
+    def owns(self, symbol: str) -> bool:
+        return self.ring.get_node(symbol) == self.worker_id
+
+    def claim(self, symbol: str) -> bool:
+        """
+        Claims the symbol for this worker, returning False when another worker
+        holds it. Claims expire after the claim TTL, by which time the trade
+        is expected to be among the ongoing trades.
+        """
+        return self.cache.acquire_lock(
+            self.__build_claim_key(symbol), self.worker_id, self.claim_ttl_in_seconds)
+
+    def release(self, symbol: str):
+        """
+        Releases the claim of the symbol, if held by this worker.
+        """
+        self.cache.release_lock(self.__build_claim_key(symbol), self.worker_id)
+
+    def __build_claim_key(self, symbol: str) -> str:
+        return f'{self.CLAIM_KEY_PREFIX}:{symbol}'
+
+
+class LeaderLock():
+    """
+    LeaderLock elects a single leader among the owners competing for the same
+    lock in the cache. The leader keeps the lock as long as it's renewed
+    within its TTL, by checking it again.
+    """
+
+    def __init__(self, cache: Cache, name: str, owner: str, ttl_in_seconds: float):
+        self.cache = cache
+        self.name = name
+        self.owner = owner
+        self.ttl_in_seconds = ttl_in_seconds
+
+    def is_leader(self) -> bool:
+        return self.cache.acquire_lock(self.name, self.owner, self.ttl_in_seconds)
+
+    def release(self):
+        self.cache.release_lock(self.name, self.owner)
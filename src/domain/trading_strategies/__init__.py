@@ -1,4 +1,6 @@
-from typing import Dict
+from typing import Dict, List
+
+import numpy
 
 
 class TradingStrategy():
@@ -17,5 +19,46 @@ class TradingStrategy():
     def __init__(self, config: Dict):
         pass
 
+    def prepare_cycle(self, symbols: List[str]):
+        """
+        Called once per trading cycle, before evaluating the given symbols, so
+        that strategies can load in bulk any data they need for them.
+        """
+        pass
+
     def should_place_order(self, df, current_price: float, symbol: str) -> bool:
+        """
+        Returns whether an order should be placed for the given symbol. The df
+        argument holds the recent technical indicators of the symbol, either as
+        klines enriched with indicators or as a dict of their latest values.
+        """
         pass
+
+    def should_place_orders(self, df, current_prices, symbols):
+        """
+        Vectorized counterpart of should_place_order. It evaluates many cases
+        at once, where the i-th case is made of the i-th row of df (klines
+        enriched with indicators, or the indicator arrays returned by
+        IndicatorMatrix.latest), the i-th current price and the i-th symbol,
+        and returns a boolean NumPy array with one element per case.
+
+        By default, should_place_order is called case by case, so strategies
+        should override it with a truly vectorized evaluation.
+        """
+        return numpy.fromiter(
+            (bool(self.should_place_order(select_case(df, i), current_price, symbol))
+             for i, (current_price, symbol) in enumerate(zip(current_prices, symbols))),
+            dtype=bool, count=len(symbols))
+
+
+def select_case(df, index: int):
+    """
+    Returns what should_place_order expects as df for the case at the given
+    index of the df given to should_place_orders: the indicator values of
+    the case, or the enriched klines up to it.
+    """
+    if df is None:
+        return None
+    if isinstance(df, dict):
+        return {name: values[index] for name, values in df.items()}
+    return df.iloc[:index + 1]
@@ -1,6 +1,7 @@
 import logging
+import numpy
 
-from . import TradingStrategy
+from . import TradingStrategy, indicators
 
 
 class Bollinger(TradingStrategy):
@@ -22,10 +23,11 @@ class Bollinger(TradingStrategy):
             config['bollinger']['minRelativeBandsDelta'])
 
     def should_place_order(self, df, current_price: float, symbol: str) -> bool:
-        bollinger_up = df.iloc[-1]['bollinger_up']
-        bollinger_low = df.iloc[-1]['bollinger_low']
+        latest = indicators.get_latest_indicators(df)
+        bollinger_up = latest['bollinger_up']
+        bollinger_low = latest['bollinger_low']
         bollinger_delta = bollinger_up - bollinger_low
-        min_bollinger_delta = self.min_relative_bands_delta * df.iloc[-1]['tp']
+        min_bollinger_delta = self.min_relative_bands_delta * latest['tp']
 
         logging.debug('Bollinger strategy params computed ' +
                       f'price={current_price} ' +
@@ -35,3 +37,11 @@ class Bollinger(TradingStrategy):
                       f'min_bbdelta={min_bollinger_delta}')
 
         return current_price < bollinger_low and bollinger_delta > min_bollinger_delta
+
+    def should_place_orders(self, df, current_prices, symbols):
+        bollinger_up = numpy.asarray(df['bollinger_up'])
+        bollinger_low = numpy.asarray(df['bollinger_low'])
+        bollinger_delta = bollinger_up - bollinger_low
+        min_bollinger_delta = self.min_relative_bands_delta * numpy.asarray(df['tp'])
+
+        return (current_prices < bollinger_low) & (bollinger_delta > min_bollinger_delta)
@@ -1,6 +1,7 @@
 import logging
+import numpy
 
-from . import TradingStrategy
+from . import TradingStrategy, indicators
 
 
 class DualMovingAverage(TradingStrategy):
@@ -18,8 +19,9 @@ class DualMovingAverage(TradingStrategy):
         pass
 
     def should_place_order(self, df, current_price: float, symbol: str) -> bool:
-        sma_50 = df.iloc[-1]['sma_50']
-        sma_200 = df.iloc[-1]['sma_200']
+        latest = indicators.get_latest_indicators(df)
+        sma_50 = latest['sma_50']
+        sma_200 = latest['sma_200']
 
         logging.debug('DMA strategy params computed ' +
                       f'price={current_price} ' +
@@ -27,3 +29,6 @@ class DualMovingAverage(TradingStrategy):
                       f'sma_200={sma_200} ')
 
         return sma_50 > sma_200
+
+    def should_place_orders(self, df, current_prices, symbols):
+        return numpy.asarray(df['sma_50']) > numpy.asarray(df['sma_200'])
@@ -0,0 +1,246 @@
+from typing import Dict, List
+from collections import deque
+
+import numpy
+
+
+def enrich_klines_with_indicators(klines):
+    """
+    Adds to the given klines all technical indicators used by the trading
+    strategies, computed over the whole frame.
+    """
+    klines['tp'] = (klines['close'] + klines['low'] + klines['high']) / 3
+    klines['std'] = klines['tp'].rolling(20).std(ddof=0)
+    klines['sma_20'] = klines['tp'].rolling(20).mean()
+    klines['sma_50'] = klines['tp'].rolling(50).mean()
+    klines['sma_200'] = klines['tp'].rolling(200).mean()
+    klines['bollinger_low'] = klines['sma_20'] - 2*klines['std']
+    klines['bollinger_up'] = klines['sma_20'] + 2*klines['std']
+    return klines
+
+
+class IndicatorMatrix():
+    """
+    IndicatorMatrix keeps the recent OHLCV klines of many symbols in a
+    symbols x time matrix, preallocated as a ring buffer over the time axis,
+    so that the indicators of all symbols are computed in a single vectorized
+    pass instead of one DataFrame per symbol.
+
+    Each column of the ring buffer is a time slot (an interval of the klines
+    open times), shared by all symbols. Klines older than the buffer capacity
+    are dropped, and slots without a kline are NaN, which makes any indicator
+    whose window includes them NaN as well, as in the pandas rolling windows.
+
+    Each row keeps the running sum and sum of squares of the typical prices in
+    every moving average window, along with the number of missing slots in it,
+    which are updated as klines are written and slots leave the windows, so
+    the latest indicators take constant time per symbol.
+    """
+
+    COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+    WINDOW_SIZES = (20, 50, 200)
+
+    def __init__(self, symbols: List[str], capacity: int = 210, interval_in_ms: int = None):
+        self.rows = {symbol: row for row, symbol in enumerate(symbols)}
+        self.symbols = list(symbols)
+        self.capacity = capacity
+        # taken from the first klines fed when not given.
+        self.interval_in_ms = interval_in_ms
+        self.last_slot = None
+        self.values = {column: numpy.full((len(symbols), capacity), numpy.nan)
+                       for column in self.COLUMNS}
+        self.tp = numpy.full((len(symbols), capacity), numpy.nan)
+        # last slot stored for each symbol, the only old one written again.
+        self.last_symbol_slots = numpy.full(len(symbols), numpy.iinfo(numpy.int64).min)
+
+        self.window_sizes = [size for size in self.WINDOW_SIZES if size <= capacity]
+        self.sums = {size: numpy.zeros(len(symbols)) for size in self.window_sizes}
+        self.squares_sums = {size: numpy.zeros(len(symbols)) for size in self.window_sizes}
+        self.missing = {size: numpy.full(len(symbols), size) for size in self.window_sizes}
+
+    def update_from_klines(self, symbol: str, klines):
+        """
+        Stores the given klines of a symbol, replacing the stored klines with
+        the same open times. The last kline may still be open.
+        """
+        open_times = klines['open_time'].to_numpy(dtype=numpy.int64)
+        if len(open_times) == 0:
+            return
+        if self.interval_in_ms is None:
+            if len(open_times) < 2:
+                return
+            self.interval_in_ms = int(numpy.min(numpy.diff(open_times)))
+
+        slots = open_times // self.interval_in_ms
+        self.__advance(int(slots[-1]))
+
+        row = self.rows[symbol]
+        begin = int(numpy.searchsorted(
+            slots, max(self.last_slot - self.capacity + 1, self.last_symbol_slots[row])))
+        slots = slots[begin:]
+        positions = slots % self.capacity
+        for column in self.COLUMNS:
+            if column in klines:
+                self.values[column][row, positions] = klines[column].to_numpy(
+                    dtype=numpy.float64)[begin:]
+        self.last_symbol_slots[row] = slots[-1]
+
+        tp = (self.values['close'][row, positions] + self.values['low'][row, positions] +
+              self.values['high'][row, positions]) / 3
+        self.__add_to_windows(row, slots, self.tp[row, positions], -1)
+        self.__add_to_windows(row, slots, tp, 1)
+        self.tp[row, positions] = tp
+
+    def latest(self, symbols: List[str] = None) -> Dict[str, numpy.ndarray]:
+        """
+        Returns the most recent indicators of the given symbols (all of them by
+        default), as one array per indicator with an element per symbol, named
+        as the columns added by enrich_klines_with_indicators.
+        """
+        if symbols is None:
+            symbols = self.symbols
+        rows = [self.rows[symbol] for symbol in symbols]
+
+        last_slot = self.last_slot if self.last_slot is not None else self.capacity - 1
+        std = self.__std(rows, 20)
+        sma_20 = self.__mean(rows, 20)
+        return {
+            'tp': self.tp[rows, last_slot % self.capacity],
+            'std': std,
+            'sma_20': sma_20,
+            'sma_50': self.__mean(rows, 50),
+            'sma_200': self.__mean(rows, 200),
+            'bollinger_low': sma_20 - 2*std,
+            'bollinger_up': sma_20 + 2*std,
+        }
+
+    def __mean(self, rows, window_size: int):
+        if window_size > self.capacity:
+            return numpy.full(len(rows), numpy.nan)
+        return numpy.where(self.missing[window_size][rows] == 0,
+                           self.sums[window_size][rows] / window_size, numpy.nan)
+
+    def __std(self, rows, window_size: int):
+        if window_size > self.capacity:
+            return numpy.full(len(rows), numpy.nan)
+        mean = self.__mean(rows, window_size)
+        variance = self.squares_sums[window_size][rows] / window_size - mean * mean
+        return numpy.sqrt(numpy.maximum(variance, 0.0))
+
+    def __add_to_windows(self, rows, slots, tp, sign: int):
+        """
+        Adds (or subtracts, with a negative sign) the typical prices of the
+        given slots to the windows including them. Missing prices are counted
+        apart, since they're NaN.
+        """
+        is_missing = numpy.isnan(tp)
+        values = numpy.where(is_missing, 0.0, tp)
+        for size in self.window_sizes:
+            in_window = slots > self.last_slot - size
+            self.sums[size][rows] += sign * numpy.sum(values * in_window, axis=-1)
+            self.squares_sums[size][rows] += sign * numpy.sum(values * values * in_window, axis=-1)
+            self.missing[size][rows] += sign * numpy.sum(is_missing & in_window, axis=-1)
+
+    def __advance(self, slot: int):
+        """
+        Moves the end of the ring buffer to the given slot, clearing the
+        columns of the slots it passes by and taking the slots that leave the
+        windows out of their sums.
+        """
+        if self.last_slot is not None and slot <= self.last_slot:
+            return
+
+        if self.last_slot is None or slot - self.last_slot >= self.capacity:
+            for values in self.values.values():
+                values.fill(numpy.nan)
+            self.tp.fill(numpy.nan)
+            self.last_symbol_slots.fill(numpy.iinfo(numpy.int64).min)
+            self.last_slot = slot
+            self.__recompute_windows()
+            return
+
+        last_slot = self.last_slot
+        for size in self.window_sizes:
+            # slots leaving the window, read before their columns are reused.
+            leaving_slots = numpy.arange(last_slot - size + 1, min(slot - size, last_slot) + 1)
+            leaving_tp = self.tp[:, leaving_slots % self.capacity]
+            is_missing = numpy.isnan(leaving_tp)
+            values = numpy.where(is_missing, 0.0, leaving_tp)
+            self.sums[size] -= values.sum(axis=1)
+            self.squares_sums[size] -= (values * values).sum(axis=1)
+            self.missing[size] += min(slot - last_slot, size) - is_missing.sum(axis=1)
+
+        positions = numpy.arange(last_slot + 1, slot + 1) % self.capacity
+        for values in self.values.values():
+            values[:, positions] = numpy.nan
+        self.tp[:, positions] = numpy.nan
+        self.last_slot = slot
+
+        # recompute the sums once per full turn of the buffer, so that
+        # floating point errors don't accumulate indefinitely.
+        if slot // self.capacity != last_slot // self.capacity:
+            self.__recompute_windows()
+
+    def __recompute_windows(self):
+        positions = numpy.arange(self.last_slot + 1 - self.capacity, self.last_slot + 1) % self.capacity
+        tp = self.tp[:, positions]
+        for size in self.window_sizes:
+            window = tp[:, -size:]
+            is_missing = numpy.isnan(window)
+            values = numpy.where(is_missing, 0.0, window)
+            self.sums[size] = values.sum(axis=1)
+            self.squares_sums[size] = (values * values).sum(axis=1)
+            self.missing[size] = is_missing.sum(axis=1)
+
+
+def get_latest_indicators(df):
+    """
+    Returns the most recent indicators, either from a dict of indicator
+    values or from the last row of klines enriched by
+    enrich_klines_with_indicators.
+    """
+    if isinstance(df, dict):
+        return df
+    return df.iloc[-1]
+
+
+class SlidingWindowMax():
+    """
+    SlidingWindowMax keeps the maximum of the values of the last window_size
+    time slots (e.g. days) using a monotonic deque, so that updating the most
+    recent slot and expiring old slots are done in amortized constant time.
+    """
+
+    def __init__(self, window_size: int):
+        self.window_size = window_size
+        self.slots = deque()  # (slot, value) with decreasing values.
+
+    def update(self, slot: int, value: float):
+        if len(self.slots) > 0 and slot < self.slots[-1][0]:
+            self.__update_past_slot(slot, value)
+            return
+
+        while len(self.slots) > 0 and self.slots[-1][1] <= value:
+            self.slots.pop()
+        self.slots.append((slot, value))
+
+    def expire(self, current_slot: int):
+        """
+        Drops the slots that are out of the window ending at current_slot.
+        """
+        while len(self.slots) > 0 and self.slots[0][0] <= current_slot - self.window_size:
+            self.slots.popleft()
+
+    def max(self) -> float:
+        if len(self.slots) == 0:
+            return None
+        return self.slots[0][1]
+
+    def __update_past_slot(self, slot: int, value: float):
+        # values of past slots are rare (e.g. the final value of the previous
+        # day), so the deque is just rebuilt with the new value in place.
+        slots = sorted(list(self.slots) + [(slot, value)],
+                       key=lambda item: (item[0], item[1]))
+        self.slots = deque()
+        for past_slot, past_value in slots:
+            self.update(past_slot, past_value)
@@ -1,12 +1,27 @@
-import time
 import logging
-import threading
 import distutils
+import numpy
 
 from src.domain.cache import Cache
-from src.domain.exchanges import Exchange
+from src.domain.clocks import Clock
+from src.domain.clocks.live import LiveClock
+from src.domain.exchanges import Exchange, fetcher
+from src.domain.sharding import LeaderLock
 
-from . import TradingStrategy
+from . import TradingStrategy, indicators
+
+
+# Binance request weight of each daily klines request.
+KLINES_REQUEST_WEIGHT = 1
+
+DAY_IN_MS = 24 * 60 * 60 * 1000
+
+# name of the lock held by the single instance updating the cache.
+LEADER_LOCK_NAME = 'period-max-cache-updater-leader'
+
+
+def build_cache_key_name(period_used_in_days) -> str:
+    return f'max-value-in-{period_used_in_days}-days'
 
 
 class PeriodMax(TradingStrategy):
@@ -17,75 +32,214 @@ class PeriodMax(TradingStrategy):
     When does it send a green signal to enter a trade?
         When the current value is higher than the maximum value of a given
         period, the trend is up and the strategy would say to buy.
+
+    The period maxima are read from the cache, where they are kept up to date
+    by a PeriodMaxUpdater, either started along with the strategy or run by
+    the period-max-updater command.
     """
 
-    def __init__(self, config, exchange: Exchange, cache: Cache, base_asset: str):
+    def __init__(self, config, exchange: Exchange, cache: Cache, base_asset: str, clock: Clock = None, leader_lock: LeaderLock = None, concurrent_fetcher: fetcher.ConcurrentFetcher = None):
         self.cache = cache
+        self.clock = clock or LiveClock()
         self.seconds_to_update_cache = config['periodMax']['secondsToUpdateCache']
         self.base_asset = base_asset
 
         self.exchange = exchange
         self.period_used_in_days = config['periodMax']['periodUsedInDays']
-        self.cache_key_name = f'max-value-in-{self.period_used_in_days}-days'
+        self.cache_key_name = build_cache_key_name(self.period_used_in_days)
+        self.symbols_period_max = {}
 
         if str(config['periodMax']['cacheUpdater']['enabled']).lower() == 'true':
-            threading.Thread(target=self.__cache_updater).start()
+            logging.info('Start running PeriodMax cache updater')
+            self.updater = PeriodMaxUpdater(
+                config, exchange, cache, self.clock, leader_lock, concurrent_fetcher)
+            self.updater.start()
+
+    def prepare_cycle(self, symbols):
+        self.symbols_period_max = dict(zip(symbols, self.__load_max_prices(symbols)))
 
     def should_place_order(self, df, current_price: float, symbol: str) -> bool:
-        max_price = self.cache.hget(self.cache_key_name, symbol)
-        if max_price == None:
-            return False
-        return current_price > float(max_price)
+        return bool(self.should_place_orders(df, [current_price], [symbol])[0])
+
+    def should_place_orders(self, df, current_prices, symbols):
+        """
+        Compares all the current prices with their period maxima at once. The
+        maxima are taken from the ones loaded by prepare_cycle, and the
+        missing ones are loaded from the cache in a single request.
+        """
+        missing_symbols = [symbol for symbol in symbols
+                           if symbol not in self.symbols_period_max]
+        symbols_period_max = self.symbols_period_max
+        if len(missing_symbols) > 0:
+            symbols_period_max = dict(zip(
+                missing_symbols, self.__load_max_prices(missing_symbols)))
+            symbols_period_max.update(self.symbols_period_max)
+
+        max_prices = numpy.fromiter((symbols_period_max[symbol] for symbol in symbols),
+                                    dtype=numpy.float64, count=len(symbols))
+        # comparisons against NaN (symbols without maximum) are always false.
+        return numpy.asarray(current_prices, dtype=numpy.float64) > max_prices
+
+    def __load_max_prices(self, symbols):
+        max_prices = self.cache.hmget(self.cache_key_name, symbols)
+        return [numpy.nan if max_price is None else float(max_price)
+                for max_price in max_prices]
+
+
+class PeriodMaxUpdater():
+    """
+    PeriodMaxUpdater keeps the period maxima of all tradable symbols up to
+    date in the cache, for the PeriodMax strategy.
+
+    Each update publishes a whole new snapshot of the maxima, atomically
+    replacing the previous one, so that readers never see a half-written
+    snapshot. When a leader lock is given, only the instance holding it
+    updates the cache, so that the exchange is queried the same no matter how
+    many instances run. The lock is renewed, or acquired by a follower, every
+    lease renewal interval, which is much shorter than the update interval, so
+    that a follower takes over soon after the leader stops.
+    """
+
+    def __init__(self, config, exchange: Exchange, cache: Cache, clock: Clock = None, leader_lock: LeaderLock = None, concurrent_fetcher: fetcher.ConcurrentFetcher = None):
+        self.exchange = exchange
+        self.cache = cache
+        self.clock = clock or LiveClock()
+        self.leader_lock = leader_lock
+        self.seconds_to_update_cache = float(config['periodMax']['secondsToUpdateCache'])
+        self.tick_interval_in_seconds = self.seconds_to_update_cache
+        if leader_lock is not None:
+            self.tick_interval_in_seconds = min(self.seconds_to_update_cache, float(
+                config['periodMax']['cacheUpdater']['leaderLockRenewIntervalInSeconds']))
+        self.updated_at = None
+        self.period_used_in_days = config['periodMax']['periodUsedInDays']
+        self.cache_key_name = build_cache_key_name(self.period_used_in_days)
+        self.fetcher = concurrent_fetcher or fetcher.ConcurrentFetcher(config)
 
-    def __cache_updater(self):
+        # sliding window maxima of the daily highs.
+        self.symbols_windows = {}
+        self.current_day = None
+
+    def run(self):
+        """
+        Runs the updater in the foreground, until its clock stops.
+        """
         logging.info('Start running PeriodMax cache updater')
-        symbols_period_max = {}
+        while True:
+            self.tick()
+            if not self.clock.advance(self.tick_interval_in_seconds):
+                break
+
+    def start(self):
+        """
+        Runs the updater in background.
+        """
+        self.clock.call_every(self.tick_interval_in_seconds, self.tick)
+
+    def tick(self):
+        """
+        Renews the leadership and updates the cache when it's due, i.e. right
+        after being elected and then every secondsToUpdateCache.
+        """
+        try:
+            if not self.__is_leader():
+                logging.debug('Skipping PeriodMax cache update: not the leader')
+                return
+        except Exception as e:
+            logging.error(f'Fail to renew PeriodMax updater leadership, error={e}')
+            return
+
+        now = self.clock.now()
+        if self.updated_at is not None and now - self.updated_at < self.seconds_to_update_cache:
+            return
+        self.updated_at = now
+        self.update()
 
+    def update(self):
         try:
             symbols_period_max = self.__build_symbols_period_max()
+            if len(symbols_period_max) == 0:
+                logging.warning('Skipping PeriodMax cache update: no period maxima found')
+                return
+            generation = self.cache.hreplace(self.cache_key_name, symbols_period_max)
+            logging.info(f'PeriodMax cache updated successfully generation={generation}')
         except Exception as e:
             logging.error(f'Fail to update cache, error={e}')
 
-        while True:
-            try:
-                self.cache.hset(self.cache_key_name, symbols_period_max)
-                logging.info('PeriodMax cache updated successfully')
-                time.sleep(self.seconds_to_update_cache)
-                symbols_period_max = self.__build_symbols_period_max()
-            except Exception as e:
-                logging.error(f'Fail to update cache, error={e}')
-                time.sleep(self.seconds_to_update_cache)
+    def __is_leader(self) -> bool:
+        if self.leader_lock is None:
+            return True
+        if self.leader_lock.is_leader():
+            return True
+        # the windows would miss the prices seen by the leader meanwhile.
+        self.symbols_windows = {}
+        self.current_day = None
+        self.updated_at = None
+        return False
 
     def __build_symbols_period_max(self):
-        threads = []
-        symbols_period_max = {}
-
-        def update_max_for_symbol(symbol):
-            klines = self.exchange.get_klines(
-                symbol, '1d', self.period_used_in_days)
-            HIGH_POSITION = 2
-            max_for_symbol = max(
-                list(map(lambda x: float(x[HIGH_POSITION]), klines)))
-            symbols_period_max[symbol] = max_for_symbol  # must be thread-safe.
-
-        current_prices = self.exchange.get_current_prices()
-        for current_price in current_prices:
-            symbol = current_price['symbol']
-            if not symbol.endswith(self.base_asset):
+        """
+        Updates the period maxima incrementally: symbols are seeded once with
+        the daily klines of the whole period, and from then on only the
+        newest daily kline is fetched, whose high (along with the current
+        price) feeds the current day, so that intraday highs reached between
+        updates aren't missed. On day rollover, the last two daily klines are
+        fetched to settle the high of the previous day, and the days out of
+        the period are expired.
+        """
+        today = int(self.clock.now() * 1000) // DAY_IN_MS
+
+        prices = {}
+        tradable_symbols = self.exchange.get_tradable_symbols()
+        snapshot = self.exchange.get_market_snapshot()
+        for symbol, price in zip(snapshot.symbols, snapshot.prices):
+            if symbol not in tradable_symbols:
                 continue
-            threads.append(threading.Thread(
-                target=update_max_for_symbol, kwargs={'symbol': symbol}))
+            prices[symbol] = float(price)
+
+        # forget symbols that are no longer listed.
+        self.symbols_windows = {symbol: window for symbol, window in self.symbols_windows.items()
+                                if symbol in prices}
 
-        # binance client start discarding connections for higher numbers.
-        MAX_SIMULTANEOUS_THREADS = 8
+        new_symbols = [symbol for symbol in prices
+                       if symbol not in self.symbols_windows]
+        self.__update_windows(new_symbols, int(self.period_used_in_days))
 
-        for i, t in enumerate(threads):
-            t.start()
-            if (i+1) % MAX_SIMULTANEOUS_THREADS == 0:
-                for j in range(MAX_SIMULTANEOUS_THREADS):
-                    threads[i-j].join()
+        known_symbols = [symbol for symbol in self.symbols_windows
+                         if symbol not in new_symbols]
+        if self.current_day is not None and today != self.current_day:
+            self.__update_windows(known_symbols, 2)
+        else:
+            self.__update_windows(known_symbols, 1)
+        self.current_day = today
 
-        for t in threads:
-            t.join()
+        symbols_period_max = {}
+        for symbol, price in prices.items():
+            window = self.symbols_windows.get(symbol)
+            if window is None:
+                continue
+            window.update(today, price)
+            window.expire(today)
+            symbols_period_max[symbol] = window.max()
 
         return symbols_period_max
+
+    def __update_windows(self, symbols, num_days):
+        OPEN_TIME_POSITION = 0
+        HIGH_POSITION = 2
+
+        def get_daily_highs(symbol):
+            klines = self.exchange.get_klines(symbol, '1d', num_days)
+            return list(map(lambda x: (int(x[OPEN_TIME_POSITION]) // DAY_IN_MS, float(x[HIGH_POSITION])), klines))
+
+        symbols_daily_highs, errors = self.fetcher.fetch(
+            symbols, get_daily_highs, KLINES_REQUEST_WEIGHT)
+        for symbol, e in errors.items():
+            logging.warning(
+                f'Fail to get daily klines for symbol {symbol}, error={e}')
+
+        for symbol, daily_highs in symbols_daily_highs.items():
+            if symbol not in self.symbols_windows:
+                self.symbols_windows[symbol] = indicators.SlidingWindowMax(
+                    int(self.period_used_in_days))
+            for day, high in daily_highs:
+                self.symbols_windows[symbol].update(day, high)
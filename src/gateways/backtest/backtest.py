@@ -1,10 +1,17 @@
+import time
 import logging
-from typing import Dict
+from typing import Dict, Set
 
 from src.gateways.binance import binance
+from src.domain.clocks.simulated import SimulatedClock
 from src.domain.entities import trading_states
+from src.domain.entities.backtest_results import BacktestResults
+from src.domain.entities.market_snapshot import MarketSnapshot, SymbolIndex
 from src.domain.exchanges import Exchange, utils
 
+from . import historical_data_manager
+from .exits import ExitResolver
+
 
 class Backtest(Exchange):
     def __init__(self, config, base_asset, asset_to_trade='ADA'):
@@ -13,8 +20,7 @@ class Backtest(Exchange):
         self.losses = 0
         self.gains = 0
 
-        binance_exchange = binance.Binance(config, base_asset)
-        self.tax = binance_exchange.tax_per_transaction
+        self.tax = float(config['binance']['taxPerTransaction'])
 
         self.base_asset = base_asset
         self.asset_to_trade = asset_to_trade
@@ -22,48 +28,45 @@ class Backtest(Exchange):
         interval_in_minutes = int(config['binanceSimulator']['intervalInMinutes'])
         num_intervals = int(config['binanceSimulator']['numberOfIntervals'])
 
-        raw_klines = binance_exchange.binance_client.get_historical_klines(
-            utils.build_symbol(asset_to_trade, base_asset),
-            f'{interval_in_minutes}m',
-            f'{interval_in_minutes * num_intervals} minutes ago UTC')
-        self.historical_data = utils.parse_klines(raw_klines)
+        symbol = utils.build_symbol(asset_to_trade, base_asset)
+        interval = f'{interval_in_minutes}m'
+        data_manager = historical_data_manager.HistoricalDataManager(config)
+        if str(config['binanceSimulator']['historicalData']['downloadMissingData']).lower() == 'true':
+            binance_exchange = binance.Binance(config, base_asset)
+            download_missing_klines(
+                binance_exchange, data_manager,
+                symbol, interval, interval_in_minutes * num_intervals)
+
+            # lower timeframe klines used to refine the exits.
+            refinement_interval_in_minutes = int(
+                config['binanceSimulator']['exits']['refinementIntervalInMinutes'] or 0)
+            if 0 < refinement_interval_in_minutes < interval_in_minutes:
+                download_missing_klines(
+                    binance_exchange, data_manager,
+                    symbol, f'{refinement_interval_in_minutes}m', interval_in_minutes * num_intervals)
+
+        self.historical_data = data_manager.get_klines(
+            symbol, interval, limit=num_intervals)
+        if len(self.historical_data) == 0:
+            raise ValueError(f'No historical data found for {symbol} {interval}')
+
         self.frame_size = 210
-        self.current_data_index = self.frame_size - 1
+        self.symbol_index = SymbolIndex()
+
+        # the simulation starts at the first bar with a full frame before it.
+        self.close = self.historical_data['close'].to_numpy(dtype=float)
+        self.exit_resolver = ExitResolver(config, symbol, self.historical_data)
+        self.clock = SimulatedClock(
+            self.historical_data['open_time'].to_numpy() / 1000.0,
+            self.__on_advance,
+            start_index=self.frame_size)
 
     def get_market_depth(self, asset_to_trade: str):
         return None
 
     def get_trading_state(self, asset_to_trade: str):
-        self.current_data_index += 1
-
-        # Ignore last trade when the simulation ends.
-        if self.current_data_index >= len(self.historical_data):
-            return trading_states.PENDING
-
         if not self.order:
             return trading_states.PENDING
-
-        current_price = self.get_current_price(asset_to_trade)
-        buy_price = self.order['price']
-        gain_price = self.order['gain_price']
-        loss_price = self.order['loss_price']
-
-        if current_price > gain_price:
-            self.gains += 1
-            multiplier = gain_price / buy_price - self.tax / 100.0
-            self.balance += self.order['quantity'] * multiplier
-            logging.warning(f'Sell finished with gain order={self.order}')
-            self.order = None
-            return trading_states.PENDING
-
-        if current_price < loss_price:
-            self.losses += 1
-            multiplier = loss_price / buy_price - self.tax / 100.0
-            self.balance += self.order['quantity'] * multiplier
-            logging.warning(f'Sell finished with loss order={self.order}')
-            self.order = None
-            return trading_states.PENDING
-
         return trading_states.TRADING
 
     def get_ongoing_trades(self):
@@ -72,8 +75,8 @@ class Backtest(Exchange):
     def get_base_asset_balance(self):
         return self.balance
 
-    def place_order(self, asset_to_trade: str, base_asset_usage_percentage, stop_loss_percentage, stop_gain_percentage):
-        logging.debug(f'Placing order data_index={self.current_data_index}')
+    def place_order(self, asset_to_trade: str, base_asset_usage_percentage, stop_loss_percentage, stop_gain_percentage, current_price: float = None):
+        logging.debug(f'Placing order data_index={self.clock.index}')
 
         price = self.get_current_price(asset_to_trade)
         gain_price = price * (100 + stop_gain_percentage + 2*self.tax) / 100.0
@@ -86,36 +89,94 @@ class Backtest(Exchange):
             'price': price,
             'gain_price': gain_price,
             'loss_price': loss_price,
+            # the whole lifetime of the trade is resolved at once.
+            'exit': self.exit_resolver.find_exit(self.clock.index + 1, gain_price, loss_price),
         }
         self.balance -= self.balance * base_asset_usage_percentage / 100.0
 
         return None, None  # buy-order, sell-order
 
     def get_current_price(self, asset_to_trade: str):
-        return float(self.historical_data.iloc[self.current_data_index]['close'])
+        return float(self.close[self.clock.index])
 
     def get_current_prices(self):
         return [
             {
                 "symbol": utils.build_symbol(self.asset_to_trade, self.base_asset),
-                "price": "40000.02"
+                "price": str(self.get_current_price(self.asset_to_trade))
             }
         ]
 
+    def get_market_snapshot(self) -> MarketSnapshot:
+        return MarketSnapshot.from_prices(self.get_current_prices(), self.symbol_index)
+
     def get_historical_klines(self, asset_to_trade: str):
-        if self.current_data_index >= len(self.historical_data):
-            logging.warning('End of simulation ' +
-                            f'losses={self.losses} ' +
-                            f'gains={self.gains} ' +
-                            f'balance={self.balance}')
-            exit(1)
-
-        begin = self.current_data_index - self.frame_size + 1
-        end = self.current_data_index
+        begin = self.clock.index - self.frame_size + 1
+        end = self.clock.index
         return self.historical_data.iloc[begin:end].copy()
 
     def get_klines(self, symbol: str, interval: str, limit: int = 1) -> Dict:
         return {}
 
+    def get_tradable_symbols(self) -> Set[str]:
+        return {utils.build_symbol(self.asset_to_trade, self.base_asset)}
+
     def reset_client(self):
         pass
+
+    def get_results(self) -> BacktestResults:
+        """
+        Returns the results of the simulation so far. The ongoing trade is
+        only accounted in the equity.
+        """
+        equity = self.balance
+        if self.order:
+            equity += self.order['quantity'] * (
+                self.get_current_price(self.asset_to_trade) / self.order['price'] - self.tax / 100.0)
+        return BacktestResults(self.gains, self.losses, self.balance,
+                               open_positions=int(bool(self.order)), equity=equity)
+
+    def __on_advance(self, previous_index: int, index: int):
+        """
+        Finishes the ongoing trade once the clock reaches its exit bar.
+        """
+        if not self.order or self.order['exit'] is None:
+            return
+
+        exit_index, is_gain = self.order['exit']
+        if exit_index > index:
+            return
+
+        buy_price = self.order['price']
+        if is_gain:
+            self.gains += 1
+            multiplier = self.order['gain_price'] / buy_price - self.tax / 100.0
+            self.balance += self.order['quantity'] * multiplier
+            logging.warning(f'Sell finished with gain order={self.order}')
+        else:
+            self.losses += 1
+            multiplier = self.order['loss_price'] / buy_price - self.tax / 100.0
+            self.balance += self.order['quantity'] * multiplier
+            logging.warning(f'Sell finished with loss order={self.order}')
+        self.order = None
+
+
+def download_missing_klines(binance_exchange, data_manager, symbol, interval, period_in_minutes):
+    """
+    Stores the closed klines of the given period that are not stored yet.
+    """
+    start = f'{period_in_minutes} minutes ago UTC'
+    last_open_time = data_manager.get_last_open_time(symbol, interval)
+    if last_open_time is not None:
+        start = last_open_time + 1
+
+    raw_klines = binance_exchange.binance_client.get_historical_klines(
+        symbol, interval, start)
+
+    # only closed klines are stored, since the store is append-only.
+    CLOSE_TIME_POSITION = 6
+    now = time.time() * 1000
+    raw_klines = [k for k in raw_klines if k[CLOSE_TIME_POSITION] < now]
+
+    logging.info(f'Storing {len(raw_klines)} new klines for {symbol} {interval}')
+    data_manager.append(symbol, interval, utils.parse_klines(raw_klines))
@@ -0,0 +1,110 @@
+import logging
+
+import numpy
+
+from . import historical_data_manager
+
+
+class ExitResolver():
+    """
+    ExitResolver finds where the OCO sell of a simulated trade finishes, by
+    scanning the prices after its entry with NumPy.
+
+    When intrabar exits are enabled, a trade finishes in the first bar whose
+    high price is above the gain price or whose low price is below the loss
+    price. If a bar crosses both, the klines of a lower timeframe are used to
+    find out which one was crossed first, and the loss is assumed to come
+    first when that's still unknown. Otherwise, only the close prices are
+    checked, as the bot itself would see them every cycle.
+    """
+
+    def __init__(self, config, symbol: str, klines):
+        exitsConfig = config['binanceSimulator']['exits']
+        self.intrabar = str(exitsConfig['intrabar']).lower() == 'true'
+        self.refinement_interval_in_minutes = int(exitsConfig['refinementIntervalInMinutes'] or 0)
+        self.interval_in_minutes = int(config['binanceSimulator']['intervalInMinutes'])
+        self.data_manager = historical_data_manager.HistoricalDataManager(config)
+        self.symbol = symbol
+
+        self.open_times = klines['open_time'].to_numpy(dtype=numpy.int64)
+        self.close = klines['close'].to_numpy(dtype=numpy.float64)
+        self.high = klines['high'].to_numpy(dtype=numpy.float64)
+        self.low = klines['low'].to_numpy(dtype=numpy.float64)
+
+    def find_exit(self, start: int, gain_price: float, loss_price: float):
+        """
+        Returns the index of the bar where the trade finishes and whether it
+        finishes with gain, or None if it doesn't finish from start onwards.
+        """
+        if not self.intrabar:
+            exit_index = find_exit_index(self.close, start, gain_price, loss_price)
+            if exit_index is None:
+                return None
+            return exit_index, bool(self.close[exit_index] > gain_price)
+
+        exit_index = find_intrabar_exit_index(
+            self.high, self.low, start, gain_price, loss_price)
+        if exit_index is None:
+            return None
+
+        is_gain = self.high[exit_index] > gain_price
+        is_loss = self.low[exit_index] < loss_price
+        if is_gain and is_loss:
+            is_gain = self.__is_gain_first(exit_index, gain_price, loss_price)
+        return exit_index, bool(is_gain)
+
+    def __is_gain_first(self, index: int, gain_price: float, loss_price: float) -> bool:
+        return is_gain_first(
+            self.data_manager, self.symbol, int(self.open_times[index]),
+            self.interval_in_minutes, self.refinement_interval_in_minutes, gain_price, loss_price)
+
+
+def is_gain_first(data_manager, symbol: str, open_time: int, interval_in_minutes: int,
+                  refinement_interval_in_minutes: int, gain_price: float, loss_price: float) -> bool:
+    """
+    Returns whether the gain price was crossed before the loss price in the
+    bar of the symbol opened at open_time, which crossed both, using the
+    stored klines of the refinement interval. The loss is assumed to come
+    first when that's still unknown.
+    """
+    if refinement_interval_in_minutes <= 0 or refinement_interval_in_minutes >= interval_in_minutes:
+        return False
+
+    klines = data_manager.get_columns(
+        symbol, f'{refinement_interval_in_minutes}m', ['high', 'low'],
+        start_time=open_time, end_time=open_time + interval_in_minutes * 60 * 1000)
+
+    exit_index = find_intrabar_exit_index(
+        klines['high'], klines['low'], 0, gain_price, loss_price)
+    if exit_index is None:
+        logging.debug(f'No lower timeframe exit found for symbol={symbol} open_time={open_time}, assuming loss')
+        return False
+    # a lower timeframe bar crossing both prices still can't tell.
+    return bool(klines['high'][exit_index] > gain_price and not klines['low'][exit_index] < loss_price)
+
+
+def find_exit_index(prices, start, gain_price, loss_price, chunk_size=256):
+    """
+    Returns the index of the first price from start onwards that is above the
+    gain price or below the loss price, or None if there is no such price.
+
+    The search is done in exponentially growing chunks, so that short trades
+    don't pay for scanning the whole remaining history.
+    """
+    return find_intrabar_exit_index(prices, prices, start, gain_price, loss_price, chunk_size)
+
+
+def find_intrabar_exit_index(high, low, start, gain_price, loss_price, chunk_size=256):
+    """
+    Returns the index of the first bar from start onwards whose high price is
+    above the gain price or whose low price is below the loss price, or None
+    if there is no such bar. It's searched in chunks, as in find_exit_index.
+    """
+    while start < len(high):
+        end = min(start + chunk_size, len(high))
+        hits = numpy.flatnonzero((high[start:end] > gain_price) | (low[start:end] < loss_price))
+        if len(hits) > 0:
+            return start + int(hits[0])
+        start = end
+        chunk_size *= 2
+    return None
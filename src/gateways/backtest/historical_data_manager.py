@@ -1,5 +1,128 @@
+import os
+from typing import Dict, List
+
+import numpy
+import pandas
+from pandas.core.frame import DataFrame
+
+
+# columns stored for each kline, along with their on-disk types. The open time
+# is the last column written by each append, so its length tells how many
+# klines were completely stored.
+COLUMNS = (
+    ('open', numpy.float64),
+    ('high', numpy.float64),
+    ('low', numpy.float64),
+    ('close', numpy.float64),
+    ('volume', numpy.float64),
+    ('close_time', numpy.float64),
+    ('quote_volume', numpy.float64),
+    ('number_of_trades', numpy.float64),
+    ('taker_buy_base_volume', numpy.float64),
+    ('taker_buy_quote_volume', numpy.float64),
+    ('open_time', numpy.int64),
+)
+
 
 class HistoricalDataManager():
+    """
+    HistoricalDataManager is a local columnar store of historical klines,
+    partitioned by symbol and interval.
+
+    Each column is kept in its own append-only binary file, which is memory
+    mapped when read, so that range reads only load the requested window.
+    """
 
     def __init__(self, config):
-        pass
+        self.path = config['binanceSimulator']['historicalData']['path']
+
+    def get_num_klines(self, symbol: str, interval: str) -> int:
+        filename = self.__build_filename(symbol, interval, 'open_time')
+        if not os.path.isfile(filename):
+            return 0
+        return os.path.getsize(filename) // numpy.dtype(numpy.int64).itemsize
+
+    def get_last_open_time(self, symbol: str, interval: str) -> int:
+        num_klines = self.get_num_klines(symbol, interval)
+        if num_klines == 0:
+            return None
+        open_times = self.__map_column(symbol, interval, 'open_time', num_klines)
+        return int(open_times[-1])
+
+    def append(self, symbol: str, interval: str, klines: DataFrame):
+        """
+        Appends the given klines to the store, ignoring the ones that are not
+        newer than the last stored kline.
+        """
+        last_open_time = self.get_last_open_time(symbol, interval)
+        open_times = klines['open_time'].to_numpy().astype(numpy.int64)
+        begin = 0
+        if last_open_time is not None:
+            begin = int(numpy.searchsorted(open_times, last_open_time, side='right'))
+        if begin >= len(open_times):
+            return
+
+        num_klines = self.get_num_klines(symbol, interval)
+        os.makedirs(os.path.dirname(
+            self.__build_filename(symbol, interval, 'open_time')), exist_ok=True)
+        for column, dtype in COLUMNS:
+            values = klines[column].to_numpy()[begin:].astype(dtype)
+            with open(self.__build_filename(symbol, interval, column), 'ab') as f:
+                # drop any leftover of an interrupted append.
+                f.truncate(num_klines * numpy.dtype(dtype).itemsize)
+                f.write(values.tobytes())
+
+    def get_symbols(self, interval: str) -> List[str]:
+        """
+        Returns the symbols with stored klines of the given interval.
+        """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(symbol for symbol in os.listdir(self.path)
+                      if self.get_num_klines(symbol, interval) > 0)
+
+    def get_klines(self, symbol: str, interval: str, start_time: int = None, end_time: int = None, limit: int = None) -> DataFrame:
+        """
+        Returns the stored klines with open time within [start_time, end_time)
+        in the same format as utils.parse_klines. When a limit is given, only
+        the last limit klines of the range are returned.
+        """
+        columns = self.get_columns(
+            symbol, interval, ['open_time'] + [column for column, _ in COLUMNS if column != 'open_time'],
+            start_time, end_time, limit)
+        open_times = columns['open_time']
+        columns['open_time'] = open_times.astype(numpy.float64)
+
+        klines = pandas.DataFrame(columns)
+        klines['time'] = pandas.to_datetime(open_times, unit='ms')
+        return klines.set_index('time')
+
+    def get_columns(self, symbol: str, interval: str, columns: List[str], start_time: int = None, end_time: int = None, limit: int = None) -> Dict[str, numpy.ndarray]:
+        """
+        Returns only the given columns of the same klines returned by
+        get_klines, as NumPy arrays in their on-disk types.
+        """
+        num_klines = self.get_num_klines(symbol, interval)
+        open_times = self.__map_column(symbol, interval, 'open_time', num_klines)
+
+        begin, end = 0, num_klines
+        if start_time is not None:
+            begin = int(numpy.searchsorted(open_times, start_time, side='left'))
+        if end_time is not None:
+            end = int(numpy.searchsorted(open_times, end_time, side='left'))
+        if limit is not None:
+            begin = max(begin, end - limit)
+        end = max(begin, end)
+
+        return {column: numpy.array(self.__map_column(symbol, interval, column, num_klines)[begin:end])
+                for column in columns}
+
+    def __map_column(self, symbol: str, interval: str, column: str, num_klines: int):
+        dtype = dict(COLUMNS)[column]
+        if num_klines == 0:
+            return numpy.empty(0, dtype=dtype)
+        return numpy.memmap(self.__build_filename(symbol, interval, column),
+                            dtype=dtype, mode='r', shape=(num_klines,))
+
+    def __build_filename(self, symbol: str, interval: str, column: str):
+        return os.path.join(self.path, symbol, interval, f'{column}.bin')
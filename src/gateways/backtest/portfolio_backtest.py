@@ -0,0 +1,323 @@
+import math
+import logging
+from typing import Dict, Set
+
+import numpy
+
+from src.gateways.binance import binance
+from src.domain.clocks.simulated import SimulatedClock
+from src.domain.entities import trading_states
+from src.domain.entities.backtest_results import BacktestResults
+from src.domain.entities.market_snapshot import MarketSnapshot, SymbolIndex
+from src.domain.exchanges import Exchange, fetcher, utils
+
+from . import exits, historical_data_manager
+from .backtest import download_missing_klines
+
+
+# Binance request weight of each historical klines request of 1000 klines.
+HISTORICAL_KLINES_REQUEST_WEIGHT = 2
+
+INTERVAL_UNITS_IN_MS = {
+    'm': 60 * 1000,
+    'h': 60 * 60 * 1000,
+    'd': 24 * 60 * 60 * 1000,
+    'w': 7 * 24 * 60 * 60 * 1000,
+}
+
+
+class PortfolioBacktest(Exchange):
+    """
+    PortfolioBacktest replays the historical klines of many symbols at once,
+    so that multi-symbol bots such as the Parallel Trader can be backtested.
+
+    The klines of all symbols are aligned to a single time grid, in matrices
+    with one row per symbol and one column per bar (NaN where a symbol has no
+    kline), and a simulated clock steps through the bars. Every trade is a
+    market buy of the given base asset amount followed by an OCO sell, and
+    the open positions are kept in arrays, so that their exits are checked
+    against the prices of each bar all at once, resolved as the ExitResolver
+    of the single pair backtest does.
+    """
+
+    def __init__(self, config, base_asset):
+        self.base_asset = base_asset
+        self.tax = float(config['binance']['taxPerTransaction'])
+
+        portfolioConfig = config['binanceSimulator']['portfolio']
+        self.balance = float(portfolioConfig['initialBalance'])
+        self.initial_balance = self.balance
+        self.gains = 0
+        self.losses = 0
+
+        interval_in_minutes = int(config['binanceSimulator']['intervalInMinutes'])
+        num_intervals = int(config['binanceSimulator']['numberOfIntervals'])
+        interval = f'{interval_in_minutes}m'
+
+        exitsConfig = config['binanceSimulator']['exits']
+        self.intrabar = str(exitsConfig['intrabar']).lower() == 'true'
+        self.refinement_interval_in_minutes = int(exitsConfig['refinementIntervalInMinutes'] or 0)
+        self.interval_in_minutes = interval_in_minutes
+
+        data_manager = historical_data_manager.HistoricalDataManager(config)
+        self.data_manager = data_manager
+        symbols = portfolioConfig['symbols'] or []
+        if isinstance(symbols, str):
+            symbols = symbols.split(',')
+        if str(config['binanceSimulator']['historicalData']['downloadMissingData']).lower() == 'true':
+            symbols = self.__download_missing_klines(
+                config, data_manager, symbols, interval, interval_in_minutes * num_intervals)
+        if len(symbols) == 0:
+            symbols = [symbol for symbol in data_manager.get_symbols(interval)
+                       if symbol.endswith(base_asset)]
+
+        self.__load_klines(data_manager, symbols, interval, num_intervals)
+        if len(self.open_times) == 0:
+            raise ValueError(f'No historical data found for {base_asset} symbols {interval}')
+
+        self.symbol_index = SymbolIndex()
+        self.symbol_index.get_positions(self.symbols)
+        self.rows = {symbol: row for row, symbol in enumerate(self.symbols)}
+
+        # open positions, one element per trade.
+        self.position_rows = numpy.empty(0, dtype=numpy.int64)
+        self.position_quantities = numpy.empty(0)
+        self.position_gain_prices = numpy.empty(0)
+        self.position_loss_prices = numpy.empty(0)
+
+        self.clock = SimulatedClock(self.open_times / 1000.0, self.__on_advance)
+
+    def get_market_depth(self, asset_to_trade: str):
+        return None
+
+    def get_trading_state(self, asset_to_trade: str):
+        if self.rows.get(utils.build_symbol(asset_to_trade, self.base_asset)) in self.position_rows:
+            return trading_states.TRADING
+        return trading_states.PENDING
+
+    def get_ongoing_trades(self):
+        return list(self.symbols[self.position_rows])
+
+    def get_base_asset_balance(self):
+        return self.balance
+
+    def place_order(self, asset_to_trade: str, base_asset_amount, stop_loss_percentage, stop_gain_percentage, current_price: float = None):
+        symbol = utils.build_symbol(asset_to_trade, self.base_asset)
+        row = self.rows.get(symbol)
+        price = numpy.nan if row is None else self.close[row, self.clock.index]
+        if numpy.isnan(price):
+            logging.warning(f'Ignoring order request: no price for symbol {symbol}')
+            return None, None
+        if base_asset_amount > self.balance:
+            logging.warning(f'Ignoring order request: insufficient {self.base_asset} balance')
+            return None, None
+
+        gain_price = price * (100 + stop_gain_percentage + 2*self.tax) / 100.0
+        loss_price = price * (100 - stop_loss_percentage + 2*self.tax) / 100.0
+        quantity = base_asset_amount / price * (1.0 - self.tax / 100.0)
+        self.balance -= base_asset_amount
+
+        self.position_rows = numpy.append(self.position_rows, row)
+        self.position_quantities = numpy.append(self.position_quantities, quantity)
+        self.position_gain_prices = numpy.append(self.position_gain_prices, gain_price)
+        self.position_loss_prices = numpy.append(self.position_loss_prices, loss_price)
+
+        logging.debug(f'Placing order symbol={symbol} price={price} ' +
+                      f'gain_price={gain_price} loss_price={loss_price} ' +
+                      f'data_index={self.clock.index}')
+
+        return None, None  # buy-order, sell-order
+
+    def get_current_price(self, asset_to_trade: str):
+        row = self.rows[utils.build_symbol(asset_to_trade, self.base_asset)]
+        return float(self.close[row, self.clock.index])
+
+    def get_current_prices(self):
+        snapshot = self.get_market_snapshot()
+        return [{'symbol': symbol, 'price': str(price)}
+                for symbol, price in zip(snapshot.symbols, snapshot.prices)]
+
+    def get_market_snapshot(self) -> MarketSnapshot:
+        prices = self.close[:, self.clock.index]
+        rows = numpy.flatnonzero(~numpy.isnan(prices))
+        return MarketSnapshot(self.symbols[rows], prices[rows], self.symbol_index, rows)
+
+    def get_historical_klines(self, asset_to_trade: str, **kwargs):
+        return None
+
+    def get_klines(self, symbol: str, interval: str, limit: int = 1) -> Dict:
+        """
+        Returns the klines of the given interval up to the current bar, in the
+        Binance raw format, built by aggregating the replayed bars. The last
+        kline is still open, as it would be in the exchange.
+        """
+        row = self.rows.get(symbol)
+        if row is None:
+            return []
+
+        interval_in_ms = int(interval[:-1]) * INTERVAL_UNITS_IN_MS[interval[-1]]
+        end = self.clock.index + 1
+        # open times are sorted, so the first bar of the first kline is found
+        # without bucketing the whole history.
+        first_open_time = (self.open_times[end - 1] // interval_in_ms - limit + 1) * interval_in_ms
+        begin = int(numpy.searchsorted(self.open_times[:end], first_open_time, side='left'))
+
+        close = self.close[row, begin:end]
+        valid = ~numpy.isnan(close)
+        if not valid.any():
+            return []
+        open_times = self.open_times[begin:end][valid]
+        close = close[valid]
+        open_prices = self.open[row, begin:end][valid]
+        high = self.high[row, begin:end][valid]
+        low = self.low[row, begin:end][valid]
+        volume = self.volume[row, begin:end][valid]
+
+        _, first_indexes = numpy.unique(open_times // interval_in_ms, return_index=True)
+        last_indexes = numpy.append(first_indexes[1:], len(open_times)) - 1
+        kline_open_times = open_times[first_indexes] // interval_in_ms * interval_in_ms
+
+        return [
+            [int(open_time), str(o), str(h), str(l), str(c), str(v),
+             int(open_time + interval_in_ms - 1), '0', 0, '0', '0', '0']
+            for open_time, o, h, l, c, v in zip(
+                kline_open_times,
+                open_prices[first_indexes],
+                numpy.maximum.reduceat(high, first_indexes),
+                numpy.minimum.reduceat(low, first_indexes),
+                close[last_indexes],
+                numpy.add.reduceat(volume, first_indexes))
+        ]
+
+    def get_tradable_symbols(self) -> Set[str]:
+        return set(self.symbols[~numpy.isnan(self.close[:, self.clock.index])])
+
+    def reset_client(self):
+        pass
+
+    def get_results(self) -> BacktestResults:
+        """
+        Returns the results of the simulation so far. The open positions are
+        only accounted in the equity, valued at their current prices.
+        """
+        prices = self.close[self.position_rows, self.clock.index]
+        open_positions_value = numpy.nansum(
+            self.position_quantities * prices * (1.0 - self.tax / 100.0))
+        return BacktestResults(self.gains, self.losses, self.balance,
+                               initial_balance=self.initial_balance,
+                               open_positions=len(self.position_rows),
+                               equity=self.balance + float(open_positions_value))
+
+    def __on_advance(self, previous_index: int, index: int):
+        """
+        Closes the positions whose OCO sell was triggered by any bar after the
+        previous one, up to the current one. With intrabar exits, the high and
+        low prices of the bars are checked, and when a bar crosses both the
+        gain and the loss prices, the lower timeframe klines tell which one
+        came first. Otherwise, only the close prices are checked.
+        """
+        for bar in range(previous_index + 1, index + 1):
+            if len(self.position_rows) == 0:
+                return
+
+            # comparisons against NaN (symbols without kline) are always false.
+            if self.intrabar:
+                crosses_gain = self.high[self.position_rows, bar] > self.position_gain_prices
+                crosses_loss = self.low[self.position_rows, bar] < self.position_loss_prices
+            else:
+                close = self.close[self.position_rows, bar]
+                crosses_gain = close > self.position_gain_prices
+                crosses_loss = close < self.position_loss_prices
+            is_closed = crosses_gain | crosses_loss
+            if not is_closed.any():
+                continue
+
+            is_gain = crosses_gain & ~crosses_loss
+            for position in numpy.flatnonzero(crosses_gain & crosses_loss):
+                is_gain[position] = exits.is_gain_first(
+                    self.data_manager, self.symbols[self.position_rows[position]],
+                    int(self.open_times[bar]), self.interval_in_minutes,
+                    self.refinement_interval_in_minutes,
+                    self.position_gain_prices[position], self.position_loss_prices[position])
+            is_loss = is_closed & ~is_gain
+
+            exit_prices = numpy.where(is_loss, self.position_loss_prices, self.position_gain_prices)
+            proceeds = self.position_quantities * exit_prices * (1.0 - self.tax / 100.0)
+            self.balance += float(proceeds[is_closed].sum())
+            self.losses += int(is_loss.sum())
+            self.gains += int(is_gain.sum())
+
+            for row, closed_with_gain in zip(self.position_rows[is_closed], is_gain[is_closed]):
+                logging.debug(f'Sell finished with {"gain" if closed_with_gain else "loss"} ' +
+                              f'symbol={self.symbols[row]} data_index={bar}')
+
+            is_open = ~is_closed
+            self.position_rows = self.position_rows[is_open]
+            self.position_quantities = self.position_quantities[is_open]
+            self.position_gain_prices = self.position_gain_prices[is_open]
+            self.position_loss_prices = self.position_loss_prices[is_open]
+
+    def __load_klines(self, data_manager, symbols, interval, num_intervals):
+        """
+        Loads the last klines of each symbol and aligns them to the union of
+        their open times, keeping only the last num_intervals bars.
+        """
+        COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume']
+        symbols_columns = {}
+        for symbol in symbols:
+            columns = data_manager.get_columns(symbol, interval, COLUMNS, limit=num_intervals)
+            if len(columns['open_time']) > 0:
+                symbols_columns[symbol] = columns
+
+        open_times = numpy.unique(numpy.concatenate(
+            [columns['open_time'] for columns in symbols_columns.values()] or
+            [numpy.empty(0, dtype=numpy.int64)]))[-num_intervals:]
+
+        self.symbols = numpy.array(list(symbols_columns), dtype=object)
+        self.open_times = open_times
+        shape = (len(self.symbols), len(open_times))
+        self.open = numpy.full(shape, numpy.nan)
+        self.high = numpy.full(shape, numpy.nan)
+        self.low = numpy.full(shape, numpy.nan)
+        self.close = numpy.full(shape, numpy.nan)
+        self.volume = numpy.full(shape, numpy.nan)
+
+        for row, columns in enumerate(symbols_columns.values()):
+            symbol_open_times = columns['open_time']
+            keep = symbol_open_times >= open_times[0]
+            positions = numpy.searchsorted(open_times, symbol_open_times[keep])
+            self.open[row, positions] = columns['open'][keep]
+            self.high[row, positions] = columns['high'][keep]
+            self.low[row, positions] = columns['low'][keep]
+            self.close[row, positions] = columns['close'][keep]
+            self.volume[row, positions] = columns['volume'][keep]
+
+        logging.info(f'Loaded {shape[1]} bars of {shape[0]} symbols for the portfolio backtest')
+
+    def __download_missing_klines(self, config, data_manager, symbols, interval, period_in_minutes):
+        binance_exchange = binance.Binance(config, self.base_asset)
+        if len(symbols) == 0:
+            symbols = sorted(binance_exchange.get_tradable_symbols())
+
+        # lower timeframe klines used to refine the exits.
+        refinement_interval = None
+        if 0 < self.refinement_interval_in_minutes < self.interval_in_minutes:
+            refinement_interval = f'{self.refinement_interval_in_minutes}m'
+
+        def download(symbol):
+            download_missing_klines(
+                binance_exchange, data_manager, symbol, interval, period_in_minutes)
+            if refinement_interval is not None:
+                download_missing_klines(
+                    binance_exchange, data_manager, symbol, refinement_interval, period_in_minutes)
+
+        weight = HISTORICAL_KLINES_REQUEST_WEIGHT * math.ceil(
+            period_in_minutes / int(interval[:-1]) / 1000)
+        if refinement_interval is not None:
+            weight += HISTORICAL_KLINES_REQUEST_WEIGHT * math.ceil(
+                period_in_minutes / self.refinement_interval_in_minutes / 1000)
+        _, errors = fetcher.ConcurrentFetcher(config).fetch(symbols, download, weight)
+        for symbol, e in errors.items():
+            logging.warning(f'Fail to download klines for symbol {symbol}, error={e}')
+
+        return symbols
@@ -0,0 +1,117 @@
+import logging
+from typing import Dict, List
+
+import numpy
+
+from src.domain.entities.backtest_results import BacktestResults
+from src.domain.trading_strategies import TradingStrategy, indicators
+
+from .exits import ExitResolver
+
+
+class VectorizedBacktest():
+    """
+    VectorizedBacktest simulates the Serial Trader bot over the whole
+    historical data at once, instead of stepping bar by bar through the
+    Backtest exchange.
+
+    Indicators are computed once over the full history, the strategies entry
+    signals are evaluated as boolean arrays and each trade exit is found by
+    the same ExitResolver used by the Backtest exchange, which scans the
+    prices with NumPy. Only the trades themselves are
+    iterated in Python, so the results (gains, losses and balance) are the
+    same as the ones reported by the Backtest exchange.
+    """
+
+    def __init__(self, config: Dict, historical_data, strategies: List[TradingStrategy], tax: float, exit_resolver: ExitResolver):
+        self.historical_data = historical_data
+        self.strategies = strategies
+        self.tax = tax
+        self.exit_resolver = exit_resolver
+
+        botConfig = config['serialTrader']
+        self.stop_loss_percentage = float(botConfig['stopLossPercentage'])
+        self.stop_gain_percentage = float(botConfig['stopGainPercentage'])
+        self.base_asset_usage_percentage = float(
+            botConfig['baseAssetUsagePercentage'])
+
+        # same frame size used by the Backtest exchange, so that trades start
+        # being evaluated at the same bar.
+        self.frame_size = 210
+
+    def run(self, enriched_klines=None):
+        """
+        Runs the simulation and returns its results.
+        Klines already enriched with indicators may be given, so that many
+        simulations over the same data compute the indicators only once.
+        """
+        klines = enriched_klines
+        if klines is None:
+            klines = indicators.enrich_klines_with_indicators(
+                self.historical_data.copy())
+        close = klines['close'].to_numpy(dtype=numpy.float64)
+        entry_signals = self.__compute_entry_signals(klines, close)
+        entries = numpy.flatnonzero(entry_signals)
+
+        balance = 1.0
+        gains = 0
+        losses = 0
+        open_positions = 0
+        open_position_value = 0.0
+
+        current_index = self.frame_size
+        while True:
+            next_entry = numpy.searchsorted(entries, current_index)
+            if next_entry >= len(entries):
+                break
+            entry_index = entries[next_entry]
+
+            price = close[entry_index]
+            gain_price = price * (100 + self.stop_gain_percentage + 2*self.tax) / 100.0
+            loss_price = price * (100 - self.stop_loss_percentage + 2*self.tax) / 100.0
+
+            # mirrors Backtest.place_order, which receives the base asset
+            # amount in the place of the base asset usage percentage.
+            base_asset_amount = balance * self.base_asset_usage_percentage / 100
+            quantity = balance * (base_asset_amount / 100.0) * (1.0 - self.tax / 100.0)
+            balance -= balance * base_asset_amount / 100.0
+
+            exit = self.exit_resolver.find_exit(
+                entry_index + 1, gain_price, loss_price)
+
+            # ignore last trade when the simulation ends.
+            if exit is None:
+                open_positions = 1
+                open_position_value = quantity * (close[-1] / price - self.tax / 100.0)
+                break
+
+            exit_index, is_gain = exit
+            if is_gain:
+                gains += 1
+                balance += quantity * (gain_price / price - self.tax / 100.0)
+                logging.debug(f'Sell finished with gain entry={entry_index} exit={exit_index}')
+            else:
+                losses += 1
+                balance += quantity * (loss_price / price - self.tax / 100.0)
+                logging.debug(f'Sell finished with loss entry={entry_index} exit={exit_index}')
+
+            # the bot looks for a new trade in the same bar the last one ended.
+            current_index = exit_index
+
+        return BacktestResults(gains, losses, float(balance), open_positions=open_positions,
+                               equity=float(balance + open_position_value))
+
+    def __compute_entry_signals(self, klines, close):
+        # the order placed at the i-th bar is decided using the indicators of
+        # the (i-1)-th bar and the close price of the i-th bar.
+        previous_klines = klines.iloc[:-1]
+        current_prices = close[1:]
+        symbols = numpy.full(len(current_prices), None)
+
+        signals = numpy.zeros(len(close), dtype=bool)
+        for strategy in self.strategies:
+            signals[1:] |= strategy.should_place_orders(
+                previous_klines, current_prices, symbols)
+
+        signals[:self.frame_size] = False
+        return signals
@@ -0,0 +1,158 @@
+import time
+import asyncio
+import logging
+import aiohttp
+import binance as bnb
+from typing import Dict, Set
+
+from src.domain.entities.market_snapshot import MarketSnapshot
+from src.domain.exchanges import AsyncExchange, utils
+
+from .binance import Binance, TERMINAL_ORDER_STATUSES
+
+
+class AsyncBinance(AsyncExchange):
+    """
+    This is an asyncio wrapper for the Binance Exchange.
+
+    Requests are sent through the python-binance AsyncClient, while the
+    symbols precision rules and order params are taken from the given blocking
+    Binance wrapper, so that both share the same exchange info.
+    """
+
+    def __init__(self, binance_exchange: Binance):
+        self.binance_exchange = binance_exchange
+        self.base_asset = binance_exchange.base_asset
+        self.tax_per_transaction = binance_exchange.tax_per_transaction
+        self.binance_client = None
+
+    async def connect(self):
+        """
+        Creates the client, with the same connection pool size and request
+        timeout of the blocking one (see binance.http).
+        """
+        client_manager = self.binance_exchange.client_manager
+        self.binance_client = await bnb.AsyncClient.create(
+            self.binance_exchange.api_key, self.binance_exchange.api_secret,
+            requests_params={'timeout': aiohttp.ClientTimeout(total=client_manager.timeout_in_seconds)})
+
+        # the session is replaced by one whose connector bounds the pool of
+        # keep-alive connections.
+        session = self.binance_client.session
+        self.binance_client.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=client_manager.pool_size),
+            headers=session.headers)
+        await session.close()
+
+    async def close(self):
+        if self.binance_client is not None:
+            await self.binance_client.close_connection()
+            self.binance_client = None
+
+    async def get_ongoing_trades(self):
+        orders = await self.binance_client.get_open_orders()
+        return list(map(lambda order: order['symbol'], orders))
+
+    async def get_base_asset_balance(self) -> float:
+        balance = await self.binance_client.get_asset_balance(asset=self.base_asset)
+        return float(balance['free'])
+
+    async def place_order(self, asset_to_trade: str, base_asset_amount, stop_loss_percentage, stop_gain_percentage, current_price: float = None):
+        symbol = utils.build_symbol(asset_to_trade, self.base_asset)
+        base_asset_amount = utils.fix_asset_precision(base_asset_amount)
+
+        if current_price is None:
+            ticker = await self.binance_client.get_symbol_ticker(symbol=symbol)
+            current_price = float(ticker['price'])
+        err = self.binance_exchange.validate_order(
+            symbol, base_asset_amount, stop_loss_percentage, current_price)
+        if err is not None:
+            self.binance_exchange.rejected_orders.inc()
+            logging.warn(f'Ignoring order request: {err}')
+            return
+
+        logging.debug('Buy order params ' +
+                      f'base_asset_amount={base_asset_amount} ' +
+                      f'asset_to_trade={asset_to_trade}')
+
+        try:
+            buy_order = await self.binance_client.order_market_buy(
+                symbol=symbol,
+                quoteOrderQty=base_asset_amount)
+        except Exception as e:
+            self.binance_exchange.failed_orders.inc()
+            logging.warn(f'Ignoring order request: {e}')
+            return
+
+        self.binance_exchange.placed_orders.inc()
+        logging.info('Buy order (market) executed successfully ' +
+                     f'base_asset_amount={base_asset_amount} ' +
+                     f'buy_order={buy_order}')
+
+        # the sell order can only be placed over the filled quantity.
+        buy_order = await self.__wait_for_fill(symbol, buy_order)
+        if float(buy_order['executedQty']) == 0:
+            logging.error(f'Buy order not filled, skipping sell order buy_order={buy_order}')
+            return buy_order, None
+
+        quantity, price, gain_price, loss_price = self.binance_exchange.build_sell_order_params(
+            symbol, buy_order, stop_loss_percentage, stop_gain_percentage)
+
+        sell_order = await self.binance_client.create_oco_order(
+            symbol=symbol,
+            side=bnb.Client.SIDE_SELL,
+            quantity=quantity,
+            price=gain_price,
+            stopPrice=loss_price,
+            stopLimitPrice=loss_price,
+            stopLimitTimeInForce=bnb.Client.TIME_IN_FORCE_GTC)
+        logging.info('Sell order (OCO) placed successfully ' +
+                     f'quantity={quantity} ' +
+                     f'price={price} ' +
+                     f'loss_price={loss_price} ' +
+                     f'gain_price={gain_price} ' +
+                     f'sell_order={sell_order}')
+
+        return buy_order, sell_order
+
+    async def get_current_prices(self):
+        return await self.binance_client.get_all_tickers()
+
+    async def get_market_snapshot(self) -> MarketSnapshot:
+        return MarketSnapshot.from_prices(
+            await self.get_current_prices(), self.binance_exchange.symbol_index)
+
+    async def get_klines(self, symbol: str, interval: str, limit: int = 1) -> Dict:
+        return await self.binance_client.get_klines(symbol=symbol, interval=interval, limit=limit)
+
+    def get_tradable_symbols(self) -> Set[str]:
+        return self.binance_exchange.get_tradable_symbols()
+
+    async def reset_client(self):
+        try:
+            await self.binance_client.ping()
+        except Exception as e:
+            logging.warning(f'Recycling unhealthy Binance client error={e}')
+            await self.close()
+            await self.connect()
+
+    async def __wait_for_fill(self, symbol, buy_order):
+        """
+        Returns the buy order as soon as it won't be filled any further,
+        polling its state until the fill timeout when it isn't finished in the
+        order response itself.
+        """
+        order = buy_order
+        deadline = time.monotonic() + self.binance_exchange.order_fill_timeout_in_seconds
+        while order['status'] not in TERMINAL_ORDER_STATUSES:
+            remaining_in_seconds = deadline - time.monotonic()
+            if remaining_in_seconds <= 0:
+                break
+            await asyncio.sleep(min(remaining_in_seconds,
+                                    self.binance_exchange.order_fill_poll_interval_in_seconds))
+            order = await self.binance_client.get_order(
+                symbol=symbol, orderId=buy_order['orderId'])
+
+        if order['status'] != 'FILLED':
+            logging.warning(f'Buy order not completely filled order={order}')
+        return order
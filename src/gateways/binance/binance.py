@@ -1,12 +1,22 @@
 import time
 import logging
+import threading
 import binance as bnb
-from typing import Dict
+from typing import Dict, Set
+from decimal import Decimal
 from pandas.core.frame import DataFrame
 
+from src.domain import metrics
 from src.domain.entities import trading_states
+from src.domain.entities.market_snapshot import MarketSnapshot, SymbolIndex
 from src.domain.exchanges import Exchange, utils
 
+from . import client_manager, kline_store, symbol_metadata
+
+
+# order statuses after which the order won't be filled any further.
+TERMINAL_ORDER_STATUSES = {'FILLED', 'CANCELED', 'EXPIRED', 'REJECTED'}
+
 
 class Binance(Exchange):
     """
@@ -26,11 +36,33 @@ class Binance(Exchange):
 
         self.api_key = config['binance']['api']['key']
         self.api_secret = config['binance']['api']['secret']
-        self.binance_client = bnb.Client(self.api_key, self.api_secret)
+        self.client_manager = client_manager.ClientManager(config)
 
-        self.exchange_info = self.__get_exchange_info()
+        self.symbol_metadata = symbol_metadata.SymbolMetadata(
+            lambda: self.binance_client.get_exchange_info(),
+            float(config['binance']['symbolMetadata']['refreshIntervalInSeconds']))
         self.base_asset = base_asset
 
+        self.kline_store = kline_store.KlineStore(config)
+        self.symbol_index = SymbolIndex()
+        self.websocket_manager = None
+
+        orderFillConfig = config['binance']['orderFill']
+        self.order_fill_timeout_in_seconds = float(orderFillConfig['timeoutInSeconds'])
+        self.order_fill_poll_interval_in_seconds = float(orderFillConfig['pollIntervalInSeconds'])
+
+        # fill events of the buy orders being waited, set by the user stream.
+        self.order_fill_events = {}
+        self.order_fill_events_lock = threading.Lock()
+
+        self.placed_orders = metrics.registry.counter('exchange_orders_total', result='placed')
+        self.rejected_orders = metrics.registry.counter('exchange_orders_total', result='rejected')
+        self.failed_orders = metrics.registry.counter('exchange_orders_total', result='failed')
+
+    @property
+    def binance_client(self):
+        return self.client_manager.client
+
     def get_market_depth(self, asset_to_trade: str):
         symbol = utils.build_symbol(asset_to_trade, self.base_asset)
         return self.binance_client.get_order_book(symbol=symbol)
@@ -49,12 +81,16 @@ class Binance(Exchange):
     def get_base_asset_balance(self):
         return float(self.binance_client.get_asset_balance(asset=self.base_asset)['free'])
 
-    def place_order(self, asset_to_trade: str, base_asset_amount, stop_loss_percentage, stop_gain_percentage):
+    def place_order(self, asset_to_trade: str, base_asset_amount, stop_loss_percentage, stop_gain_percentage, current_price: float = None):
         symbol = utils.build_symbol(asset_to_trade, self.base_asset)
         base_asset_amount = utils.fix_asset_precision(base_asset_amount)
 
-        err = self.__validate_order(symbol, base_asset_amount, stop_loss_percentage)
+        # the price from the caller snapshot avoids a duplicate ticker request.
+        if current_price is None:
+            current_price = float(self.binance_client.get_all_tickers(symbol)['price'])
+        err = self.validate_order(symbol, base_asset_amount, stop_loss_percentage, current_price)
         if err is not None:
+            self.rejected_orders.inc()
             logging.warn(f'Ignoring order request: {err}')
             return
 
@@ -67,33 +103,23 @@ class Binance(Exchange):
                 symbol=symbol,
                 quoteOrderQty=base_asset_amount)
         except Exception as e:
+            self.failed_orders.inc()
             logging.warn(f'Ignoring order request: {e}')
             return
 
+        self.placed_orders.inc()
         logging.info('Buy order (market) executed successfully ' +
                      f'base_asset_amount={base_asset_amount} ' +
                      f'buy_order={buy_order}')
 
-        price = float(buy_order['fills'][0]['price'])
-        gain_price = utils.fix_asset_precision(
-            price * (100 + stop_gain_percentage + 2*self.tax_per_transaction) / 100.0)
-        loss_price = utils.fix_asset_precision(
-            price * (100 - stop_loss_percentage + 2*self.tax_per_transaction) / 100.0)
-        quantity = utils.fix_asset_precision(
-            float(buy_order['executedQty']) * (99.999 - self.tax_per_transaction) / 100.0)
+        # the sell order can only be placed over the filled quantity.
+        buy_order = self.__wait_for_fill(symbol, buy_order)
+        if float(buy_order['executedQty']) == 0:
+            logging.error(f'Buy order not filled, skipping sell order buy_order={buy_order}')
+            return buy_order, None
 
-        # wait 1s to guarantee correct execution order in the exchange.
-        time.sleep(1)
-
-        quantity, gain_price, loss_price = self.__fix_order_params(symbol, quantity, gain_price, loss_price)
-
-        logging.debug('Sell order params ' +
-                      f'quantity={quantity} ' +
-                      f'price={price} ' +
-                      f'loss_price={loss_price} ' +
-                      f'gain_price={gain_price} ' +
-                      f'tick_size={self.__get_tick_size(symbol)} ' +
-                      f'step_size={self.__get_step_size(symbol)}')
+        quantity, price, gain_price, loss_price = self.build_sell_order_params(
+            symbol, buy_order, stop_loss_percentage, stop_gain_percentage)
 
         sell_order = self.binance_client.create_oco_order(
             symbol=symbol,
@@ -120,72 +146,165 @@ class Binance(Exchange):
     def get_current_prices(self):
         return self.binance_client.get_all_tickers()
 
+    def get_market_snapshot(self) -> MarketSnapshot:
+        return MarketSnapshot.from_prices(self.get_current_prices(), self.symbol_index)
+
     def get_historical_klines(self, asset_to_trade: str, num_intervals=210) -> DataFrame:
-        self.reset_client()  # avoid connection problems.
-        raw_klines = self.binance_client.get_historical_klines(
-            utils.build_symbol(asset_to_trade, self.base_asset),
-            f'{self.interval_in_minutes}m',
-            f'{self.interval_in_minutes * num_intervals} minutes ago UTC')
-        return utils.parse_klines(raw_klines)
+        symbol = utils.build_symbol(asset_to_trade, self.base_asset)
+        interval = f'{self.interval_in_minutes}m'
+
+        # only request the klines newer than the last stored one, which is
+        # requested again since it may have been still open when stored.
+        last_open_time = self.kline_store.get_last_open_time(symbol, interval)
+        window_in_ms = self.interval_in_minutes * num_intervals * 60 * 1000
+        if last_open_time is None or time.time() * 1000 - last_open_time >= window_in_ms:
+            raw_klines = self.binance_client.get_historical_klines(
+                symbol,
+                interval,
+                f'{self.interval_in_minutes * num_intervals} minutes ago UTC')
+        else:
+            raw_klines = self.binance_client.get_klines(
+                symbol=symbol,
+                interval=interval,
+                startTime=last_open_time,
+                limit=num_intervals)
+
+        klines = self.kline_store.update(
+            symbol, interval, raw_klines, num_intervals)
+        return klines.copy()
 
     def get_klines(self, symbol: str, interval: str, limit: int = 1) -> Dict:
         return self.binance_client.get_klines(symbol=symbol, interval=interval, limit=limit)
 
-    def reset_client(self):
-        self.binance_client = bnb.Client(self.api_key, self.api_secret)
-
-    def __get_exchange_info(self):
-        info = self.binance_client.get_exchange_info()
-
-        symbols_info = {}
-        for symbol_info in info['symbols']:
-            symbols_info[symbol_info['symbol']] = symbol_info
-            filters = {}
-            for filter in symbols_info[symbol_info['symbol']]['filters']:
-                filters[filter['filterType']] = filter
-            symbols_info[symbol_info['symbol']]['filters'] = filters
+    def get_tradable_symbols(self) -> Set[str]:
+        return self.symbol_metadata.get_tradable_symbols(self.base_asset)
 
-        info['symbols'] = symbols_info
-        return info
-
-    def __validate_order(self, symbol, quantity_in_base_asset, stop_loss_percentage):
-        current_price = float(self.binance_client.get_all_tickers(symbol)['price'])
+    def reset_client(self):
+        self.client_manager.recycle_if_unhealthy()
+
+    def start_streams(self, on_prices, on_user_data):
+        self.websocket_manager = bnb.ThreadedWebsocketManager(
+            api_key=self.api_key, api_secret=self.api_secret)
+        self.websocket_manager.start()
+
+        def handle_miniticker(msg):
+            if isinstance(msg, dict) and msg.get('e') == 'error':
+                logging.error(f'Fail to stream market data error={msg}')
+                return
+            on_prices(MarketSnapshot(
+                [ticker['s'] for ticker in msg],
+                [float(ticker['c']) for ticker in msg],
+                self.symbol_index))
+
+        def handle_user_data(msg):
+            if msg.get('e') == 'error':
+                logging.error(f'Fail to stream user data error={msg}')
+                return
+            if msg.get('e') == 'executionReport' and msg['X'] in TERMINAL_ORDER_STATUSES:
+                with self.order_fill_events_lock:
+                    fill_event = self.order_fill_events.get(msg['i'])
+                if fill_event is not None:
+                    fill_event.set()
+            on_user_data(msg)
+
+        self.websocket_manager.start_miniticker_socket(callback=handle_miniticker)
+        self.websocket_manager.start_user_socket(callback=handle_user_data)
+
+    def stop_streams(self):
+        if self.websocket_manager is not None:
+            self.websocket_manager.stop()
+            self.websocket_manager = None
+
+    def __wait_for_fill(self, symbol, buy_order):
+        """
+        Returns the buy order as soon as it won't be filled any further, e.g.
+        filled or expired after a partial fill. Market orders usually finish
+        in the order response itself, otherwise its state is checked again
+        every poll interval until the fill timeout.
+
+        While the streams are started, the user stream also reports the end
+        of the order, checking it right away. This requires the orders to be
+        placed outside of the stream callbacks, which would otherwise block
+        the stream delivering the report.
+        """
+        if buy_order['status'] in TERMINAL_ORDER_STATUSES:
+            return buy_order
+
+        order_id = buy_order['orderId']
+        fill_event = threading.Event()
+        with self.order_fill_events_lock:
+            self.order_fill_events[order_id] = fill_event
 
-        step_size = self.__get_step_size(symbol)
-        quantity_in_base_asset = float(quantity_in_base_asset)
-        quantity = quantity_in_base_asset / current_price
-        truncated_quantity = float(utils.fix_asset_precision(quantity - (quantity % step_size)))
+        try:
+            deadline = time.monotonic() + self.order_fill_timeout_in_seconds
+            while True:
+                order = self.binance_client.get_order(symbol=symbol, orderId=order_id)
+                remaining_in_seconds = deadline - time.monotonic()
+                if order['status'] in TERMINAL_ORDER_STATUSES or remaining_in_seconds <= 0:
+                    break
+                fill_event.wait(min(remaining_in_seconds,
+                                    self.order_fill_poll_interval_in_seconds))
+        finally:
+            with self.order_fill_events_lock:
+                del self.order_fill_events[order_id]
+
+        if order['status'] != 'FILLED':
+            logging.warning(f'Buy order not completely filled order={order}')
+        return order
+
+    def validate_order(self, symbol, quantity_in_base_asset, stop_loss_percentage, current_price):
+        """
+        Returns the reason why an order can't be placed for the symbol at the
+        given price, or None if it's valid.
+        """
+        rules = self.symbol_metadata.get(symbol)
+
+        quantity = Decimal(str(quantity_in_base_asset)) / Decimal(str(current_price))
+        truncated_quantity = rules.round_quantity(quantity)
 
-        tick_size = self.__get_tick_size(symbol)
         loss_price = current_price * (100 - stop_loss_percentage + 2*self.tax_per_transaction) / 100.0
-        truncated_loss_price = float(utils.fix_asset_precision(loss_price - (loss_price % tick_size)))
+        truncated_loss_price = rules.round_price(loss_price)
 
         estimated_quantity_in_stop_loss = truncated_quantity * truncated_loss_price
-        min_notional = self.__get_min_notional(symbol)
-
-        if estimated_quantity_in_stop_loss < min_notional:
+        if estimated_quantity_in_stop_loss < rules.min_notional:
             return 'quantity for stop loss is lower than min notional'
 
         return None
 
-    def __fix_order_params(self, symbol, quantity, gain_price, loss_price):
-        step_size = self.__get_step_size(symbol)
-        quantity = float(quantity)
-        quantity = utils.fix_asset_precision(quantity - (quantity % step_size))
+    def build_sell_order_params(self, symbol, buy_order, stop_loss_percentage, stop_gain_percentage):
+        """
+        Returns the quantity, buy price, gain price and loss price of the OCO
+        sell order that closes the trade opened by the given buy order, already
+        fixed to the symbol precision rules.
+        """
+        rules = self.symbol_metadata.get(symbol)
+
+        price = get_buy_price(buy_order)
+        gain_price = rules.round_price(
+            price * (100 + stop_gain_percentage + 2*self.tax_per_transaction) / 100.0)
+        loss_price = rules.round_price(
+            price * (100 - stop_loss_percentage + 2*self.tax_per_transaction) / 100.0)
+        quantity = rules.round_quantity(
+            float(buy_order['executedQty']) * (99.999 - self.tax_per_transaction) / 100.0)
 
-        tick_size = self.__get_tick_size(symbol)
-        gain_price = float(gain_price)
-        gain_price = utils.fix_asset_precision(gain_price - (gain_price % tick_size))
-        loss_price = float(loss_price)
-        loss_price = utils.fix_asset_precision(loss_price - (loss_price % tick_size))
+        quantity, gain_price, loss_price = format(quantity, 'f'), format(gain_price, 'f'), format(loss_price, 'f')
 
-        return quantity, gain_price, loss_price
+        logging.debug('Sell order params ' +
+                      f'quantity={quantity} ' +
+                      f'price={price} ' +
+                      f'loss_price={loss_price} ' +
+                      f'gain_price={gain_price} ' +
+                      f'tick_size={rules.get_tick_size()} ' +
+                      f'step_size={rules.get_step_size()}')
 
-    def __get_step_size(self, symbol):
-        return float(self.exchange_info['symbols'][symbol]['filters']['LOT_SIZE']['stepSize'])
+        return quantity, price, gain_price, loss_price
 
-    def __get_tick_size(self, symbol):
-        return float(self.exchange_info['symbols'][symbol]['filters']['PRICE_FILTER']['tickSize'])
 
-    def __get_min_notional(self, symbol):
-        return float(self.exchange_info['symbols'][symbol]['filters']['MIN_NOTIONAL']['minNotional'])
+def get_buy_price(buy_order):
+    """
+    Returns the price of the given buy order, taken from its first fill or,
+    when the order doesn't carry its fills, from its average price.
+    """
+    if len(buy_order.get('fills', [])) > 0:
+        return float(buy_order['fills'][0]['price'])
+    return float(buy_order['cummulativeQuoteQty']) / float(buy_order['executedQty'])
@@ -0,0 +1,44 @@
+import logging
+import binance as bnb
+from requests.adapters import HTTPAdapter
+
+
+class ClientManager():
+    """
+    ClientManager keeps a single Binance client, whose HTTP session holds a
+    pool of keep-alive connections, so that requests don't pay for a new TLS
+    handshake. The client is only recycled when it's actually unhealthy.
+    """
+
+    def __init__(self, config):
+        self.api_key = config['binance']['api']['key']
+        self.api_secret = config['binance']['api']['secret']
+
+        httpConfig = config['binance']['http']
+        self.pool_size = int(httpConfig['poolSize'])
+        self.timeout_in_seconds = float(httpConfig['timeoutInSeconds'])
+
+        self.client = self.__build_client()
+
+    def recycle_if_unhealthy(self):
+        """
+        Checks the client connection and replaces the client only if the
+        check fails.
+        """
+        try:
+            self.client.ping()
+        except Exception as e:
+            logging.warning(f'Recycling unhealthy Binance client error={e}')
+            self.client.session.close()
+            self.client = self.__build_client()
+
+    def __build_client(self):
+        client = bnb.Client(
+            self.api_key,
+            self.api_secret,
+            requests_params={'timeout': self.timeout_in_seconds})
+
+        adapter = HTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size)
+        client.session.mount('https://', adapter)
+        return client
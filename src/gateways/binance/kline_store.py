@@ -0,0 +1,87 @@
+import os
+import logging
+from typing import Dict
+
+import pandas
+from pandas.core.frame import DataFrame
+
+from src.domain.exchanges import utils
+
+
+class KlineStore():
+    """
+    KlineStore keeps the most recent klines window of each symbol in memory,
+    persisting it to disk between runs, so that only klines newer than the
+    last stored one need to be requested to the exchange.
+    """
+
+    def __init__(self, config):
+        self.path = config['binance']['klineStore']['path']
+        self.klines: Dict[str, DataFrame] = {}
+
+    def get(self, symbol: str, interval: str) -> DataFrame:
+        """
+        Returns the stored klines for the given symbol and interval, or None
+        if there is no stored data.
+        """
+        key = self.__build_key(symbol, interval)
+        if key not in self.klines:
+            self.klines[key] = self.__load(key)
+        return self.klines[key]
+
+    def get_last_open_time(self, symbol: str, interval: str) -> int:
+        klines = self.get(symbol, interval)
+        if klines is None or len(klines) == 0:
+            return None
+        return int(klines['open_time'].iloc[-1])
+
+    def update(self, symbol: str, interval: str, raw_klines, window_size: int) -> DataFrame:
+        """
+        Merges the given raw klines into the stored ones, replacing any stored
+        kline with the same or a later open time, and keeps only the last
+        window_size klines.
+        """
+        key = self.__build_key(symbol, interval)
+        new_klines = utils.parse_klines(raw_klines, utils.OHLCV_COLUMNS)
+        stored_klines = self.get(symbol, interval)
+
+        if stored_klines is None or len(stored_klines) == 0:
+            klines = new_klines
+        elif len(new_klines) == 0:
+            klines = stored_klines
+        else:
+            first_open_time = new_klines['open_time'].iloc[0]
+            stored_klines = stored_klines[stored_klines['open_time']
+                                          < first_open_time][new_klines.columns]
+            klines = pandas.concat([stored_klines, new_klines])
+
+        klines = klines.iloc[-window_size:]
+        self.klines[key] = klines
+        self.__persist(key, klines)
+        return klines
+
+    def __build_key(self, symbol: str, interval: str):
+        return f'{symbol}-{interval}'
+
+    def __build_filename(self, key: str):
+        return os.path.join(self.path, f'{key}.pkl')
+
+    def __load(self, key: str) -> DataFrame:
+        filename = self.__build_filename(key)
+        if not os.path.isfile(filename):
+            return None
+        try:
+            return pandas.read_pickle(filename)
+        except Exception as e:
+            logging.warning(f'Ignoring stored klines file={filename} error={e}')
+            return None
+
+    def __persist(self, key: str, klines: DataFrame):
+        filename = self.__build_filename(key)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            # write and rename, so that a crash never leaves a corrupted file.
+            klines.to_pickle(f'{filename}.tmp')
+            os.replace(f'{filename}.tmp', filename)
+        except Exception as e:
+            logging.warning(f'Fail to persist klines file={filename} error={e}')
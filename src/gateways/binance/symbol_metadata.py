@@ -0,0 +1,110 @@
+import time
+import threading
+from decimal import Decimal, ROUND_DOWN
+from typing import Callable, Dict, Set
+
+
+class SymbolRules():
+    """
+    SymbolRules holds the trading rules of a symbol. Tick and step sizes are
+    stored as integer decimal exponents and multipliers (size = multiplier *
+    10^exponent), so that rounding is done with integer arithmetic.
+    """
+
+    def __init__(self, symbol_info: Dict):
+        filters = {}
+        for filter in symbol_info['filters']:
+            filters[filter['filterType']] = filter
+
+        self.symbol = symbol_info['symbol']
+        self.base_asset = symbol_info['baseAsset']
+        self.quote_asset = symbol_info['quoteAsset']
+        self.is_trading = symbol_info['status'] == 'TRADING'
+        self.is_oco_allowed = bool(symbol_info.get('ocoAllowed', True))
+
+        self.tick_multiplier, self.tick_exponent = split_size(
+            filters['PRICE_FILTER']['tickSize'])
+        self.step_multiplier, self.step_exponent = split_size(
+            filters['LOT_SIZE']['stepSize'])
+
+        notional_filter = filters.get('MIN_NOTIONAL') or filters.get('NOTIONAL')
+        self.min_notional = Decimal(notional_filter['minNotional']) if notional_filter else Decimal(0)
+
+    def get_tick_size(self) -> Decimal:
+        return Decimal(self.tick_multiplier).scaleb(self.tick_exponent)
+
+    def get_step_size(self) -> Decimal:
+        return Decimal(self.step_multiplier).scaleb(self.step_exponent)
+
+    def round_price(self, price) -> Decimal:
+        return round_down(price, self.tick_multiplier, self.tick_exponent)
+
+    def round_quantity(self, quantity) -> Decimal:
+        return round_down(quantity, self.step_multiplier, self.step_exponent)
+
+
+class SymbolMetadata():
+    """
+    SymbolMetadata is an index of the rules of all symbols, built from the
+    exchange info and refreshed once it's older than the refresh interval.
+    """
+
+    def __init__(self, load_exchange_info: Callable, refresh_interval_in_seconds: float):
+        self.load_exchange_info = load_exchange_info
+        self.refresh_interval_in_seconds = refresh_interval_in_seconds
+        self.lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        info = self.load_exchange_info()
+        rules = {}
+        for symbol_info in info['symbols']:
+            rules[symbol_info['symbol']] = SymbolRules(symbol_info)
+
+        with self.lock:
+            self.rules = rules
+            self.symbols_by_quote_asset = {}
+            self.refreshed_at = time.monotonic()
+
+    def get(self, symbol: str) -> SymbolRules:
+        self.__refresh_if_stale()
+        return self.rules[symbol]
+
+    def get_tradable_symbols(self, quote_asset: str) -> Set[str]:
+        """
+        Returns the symbols currently trading against the given quote asset
+        that accept OCO orders.
+        """
+        self.__refresh_if_stale()
+        with self.lock:
+            if quote_asset not in self.symbols_by_quote_asset:
+                self.symbols_by_quote_asset[quote_asset] = frozenset(
+                    symbol for symbol, rules in self.rules.items()
+                    if rules.quote_asset == quote_asset and rules.is_trading and rules.is_oco_allowed)
+            return self.symbols_by_quote_asset[quote_asset]
+
+    def __refresh_if_stale(self):
+        if time.monotonic() - self.refreshed_at >= self.refresh_interval_in_seconds:
+            self.refresh()
+
+
+def split_size(size: str):
+    """
+    Splits a size such as '0.00500000' into its integer multiplier and decimal
+    exponent, e.g. (5, -3).
+    """
+    sign, digits, exponent = Decimal(size).normalize().as_tuple()
+    multiplier = 0
+    for digit in digits:
+        multiplier = multiplier * 10 + digit
+    return multiplier, exponent
+
+
+def round_down(value, multiplier: int, exponent: int) -> Decimal:
+    """
+    Truncates the value to a multiple of multiplier * 10^exponent.
+    """
+    units = int(Decimal(str(value)).scaleb(-exponent).to_integral_value(ROUND_DOWN))
+    if multiplier > 0:
+        units -= units % multiplier
+    return Decimal(units).scaleb(exponent)
@@ -0,0 +1,73 @@
+from typing import Dict, List
+
+import time
+import threading
+
+from src.domain.cache import Cache, build_generation_key
+
+
+class Dictionary(Cache):
+    """
+    Dictionary is a standalone in-process cache, backed by plain dicts. It's
+    meant for simulations, where nothing should be shared with other
+    processes.
+    """
+
+    def __init__(self, config=None):
+        self.lock = threading.Lock()
+        self.hashes: Dict[str, Dict] = {}
+        self.values: Dict[str, object] = {}
+        self.locks: Dict[str, tuple] = {}  # name -> (owner, expires_at)
+
+    def hset(self, name: str, mapping: Dict):
+        with self.lock:
+            self.hashes.setdefault(name, {}).update(mapping)
+
+    def hreplace(self, name: str, mapping: Dict) -> int:
+        with self.lock:
+            self.hashes[name] = dict(mapping)
+            generation_key = build_generation_key(name)
+            self.values[generation_key] = int(self.values.get(generation_key) or 0) + 1
+            return self.values[generation_key]
+
+    def hget(self, name: str, key: str) -> str:
+        with self.lock:
+            return self.hashes.get(name, {}).get(key)
+
+    def hmget(self, name: str, keys: List[str]) -> List[str]:
+        with self.lock:
+            values = self.hashes.get(name, {})
+            return [values.get(key) for key in keys]
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        with self.lock:
+            return dict(self.hashes.get(name, {}))
+
+    def hdel(self, name: str, keys: List[str]):
+        with self.lock:
+            values = self.hashes.get(name, {})
+            for key in keys:
+                values.pop(key, None)
+
+    def get(self, name: str) -> str:
+        with self.lock:
+            return self.values.get(name)
+
+    def incr(self, name: str) -> int:
+        with self.lock:
+            self.values[name] = int(self.values.get(name) or 0) + 1
+            return self.values[name]
+
+    def acquire_lock(self, name: str, owner: str, ttl_in_seconds: float) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            current_owner, expires_at = self.locks.get(name, (None, now))
+            if current_owner is not None and current_owner != owner and expires_at > now:
+                return False
+            self.locks[name] = (owner, now + ttl_in_seconds)
+            return True
+
+    def release_lock(self, name: str, owner: str):
+        with self.lock:
+            if self.locks.get(name, (None, None))[0] == owner:
+                del self.locks[name]
@@ -0,0 +1,136 @@
+from typing import Dict, List
+
+import time
+import threading
+from collections import OrderedDict
+
+from src.domain.cache import Cache, build_generation_key
+
+
+# marks values that are not in the local cache, since None is a valid value.
+_MISSING = object()
+
+
+class Memory(Cache):
+    """
+    Memory is an in-process read-through cache in front of another cache,
+    such as Redis.
+
+    Hash fields read from the backend are kept locally until their TTL
+    expires, evicting the least recently used ones when the cache is full.
+    Each hash also has a generation counter stored in the backend, which is
+    incremented on every write, so that a new snapshot written by any process
+    invalidates the whole hash locally at once. The generation is checked in
+    the backend at most once per generationCheckIntervalInSeconds.
+    """
+
+    def __init__(self, config, backend: Cache):
+        self.backend = backend
+
+        cacheConfig = config['memoryCache']
+        self.ttl_in_seconds = float(cacheConfig['ttlInSeconds'])
+        self.max_size = int(cacheConfig['maxSize'])
+        self.generation_check_interval_in_seconds = float(
+            cacheConfig['generationCheckIntervalInSeconds'])
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # (name, key) -> (value, expires_at, generation)
+        self.generations = {}  # name -> (generation, checked_at)
+
+    def hset(self, name: str, mapping: Dict):
+        self.backend.hset(name, mapping)
+        self.__set_generation(name, self.backend.incr(build_generation_key(name)))
+
+    def hreplace(self, name: str, mapping: Dict) -> int:
+        generation = self.backend.hreplace(name, mapping)
+        self.__set_generation(name, generation)
+        return generation
+
+    def hget(self, name: str, key: str) -> str:
+        return self.hmget(name, [key])[0]
+
+    def hmget(self, name: str, keys: List[str]) -> List[str]:
+        generation = self.__get_generation(name)
+        now = time.monotonic()
+
+        values = []
+        missing_keys = []
+        with self.lock:
+            for key in keys:
+                value = self.__get_entry(name, key, generation, now)
+                if value is _MISSING:
+                    missing_keys.append(key)
+                values.append(value)
+
+        if len(missing_keys) == 0:
+            return values
+
+        fetched = dict(zip(missing_keys, self.backend.hmget(name, missing_keys)))
+        with self.lock:
+            for key, value in fetched.items():
+                self.__set_entry(name, key, value, generation, now)
+
+        return [fetched[key] if value is _MISSING else value
+                for key, value in zip(keys, values)]
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        generation = self.__get_generation(name)
+        values = self.backend.hgetall(name)
+        now = time.monotonic()
+        with self.lock:
+            for key, value in values.items():
+                self.__set_entry(name, key, value, generation, now)
+        return values
+
+    def hdel(self, name: str, keys: List[str]):
+        self.backend.hdel(name, keys)
+        with self.lock:
+            for key in keys:
+                self.entries.pop((name, key), None)
+
+    def get(self, name: str) -> str:
+        return self.backend.get(name)
+
+    def incr(self, name: str) -> int:
+        return self.backend.incr(name)
+
+    def acquire_lock(self, name: str, owner: str, ttl_in_seconds: float) -> bool:
+        return self.backend.acquire_lock(name, owner, ttl_in_seconds)
+
+    def release_lock(self, name: str, owner: str):
+        self.backend.release_lock(name, owner)
+
+    def __get_generation(self, name: str):
+        now = time.monotonic()
+        with self.lock:
+            generation, checked_at = self.generations.get(name, (None, None))
+            if checked_at is not None and now - checked_at < self.generation_check_interval_in_seconds:
+                return generation
+
+        generation = self.backend.get(build_generation_key(name))
+        with self.lock:
+            self.generations[name] = (generation, now)
+        return generation
+
+    def __set_generation(self, name: str, generation: int):
+        with self.lock:
+            self.generations[name] = (str(generation).encode(), time.monotonic())
+
+    def __get_entry(self, name: str, key: str, generation, now: float):
+        entry = self.entries.get((name, key))
+        if entry is None:
+            return _MISSING
+
+        value, expires_at, entry_generation = entry
+        if expires_at <= now or entry_generation != generation:
+            del self.entries[(name, key)]
+            return _MISSING
+
+        self.entries.move_to_end((name, key))
+        return value
+
+    def __set_entry(self, name: str, key: str, value, generation, now: float):
+        self.entries[(name, key)] = (value, now + self.ttl_in_seconds, generation)
+        self.entries.move_to_end((name, key))
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
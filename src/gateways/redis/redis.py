@@ -1,9 +1,10 @@
-from typing import Dict
+from typing import Dict, List
 
+import uuid
 import redis
 import logging
 
-from src.domain.cache import Cache
+from src.domain.cache import Cache, build_generation_key
 
 
 class Redis(Cache):
@@ -14,8 +15,71 @@ class Redis(Cache):
         )
 
     def hset(self, name: str, mapping: Dict):
-        for k, v in mapping.items():
-            self.redis_client.hset(name, k, v)
+        if len(mapping) == 0:
+            return
+        self.redis_client.hset(name, mapping=mapping)
+
+    def hreplace(self, name: str, mapping: Dict) -> int:
+        # the new hash is written aside and then renamed over the old one,
+        # along with the generation, in a single transaction.
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            if len(mapping) == 0:
+                pipe.delete(name)
+            else:
+                temporary_name = f'{name}:{uuid.uuid4().hex}'
+                pipe.hset(temporary_name, mapping=mapping)
+                pipe.rename(temporary_name, name)
+            pipe.incr(build_generation_key(name))
+            return pipe.execute()[-1]
 
     def hget(self, name: str, key: str) -> str:
         return self.redis_client.hget(name, key)
+
+    def hmget(self, name: str, keys: List[str]) -> List[str]:
+        if len(keys) == 0:
+            return []
+        return self.redis_client.hmget(name, keys)
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        return {k.decode(): v for k, v in self.redis_client.hgetall(name).items()}
+
+    def hdel(self, name: str, keys: List[str]):
+        if len(keys) == 0:
+            return
+        self.redis_client.hdel(name, *keys)
+
+    def get(self, name: str) -> str:
+        return self.redis_client.get(name)
+
+    def incr(self, name: str) -> int:
+        return self.redis_client.incr(name)
+
+    def acquire_lock(self, name: str, owner: str, ttl_in_seconds: float) -> bool:
+        ttl_in_ms = int(ttl_in_seconds * 1000)
+        if self.redis_client.set(name, owner, nx=True, px=ttl_in_ms):
+            return True
+
+        # renew the lock only if it's still held by the owner when renewed.
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(name)
+                if pipe.get(name) != owner.encode():
+                    return False
+                pipe.multi()
+                pipe.pexpire(name, ttl_in_ms)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def release_lock(self, name: str, owner: str):
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(name)
+                if pipe.get(name) != owner.encode():
+                    return
+                pipe.multi()
+                pipe.delete(name)
+                pipe.execute()
+            except redis.WatchError:
+                logging.debug(f'Lock changed while being released name={name}')
@@ -0,0 +1,100 @@
+import fakeredis
+
+from src.cmd.parallel_trader import ParallelTrader
+from src.domain.entities.market_snapshot import MarketSnapshot, SymbolIndex
+from src.domain.sharding import Shard
+from src.domain.trading_strategies import TradingStrategy
+from src.gateways.redis import redis
+
+
+CONFIG = {
+    'redis': {'host': 'localhost', 'port': 6379},
+    'parallelTrader': {
+        'baseAsset': 'USDT',
+        'cycleTimeInSeconds': 15,
+        'stopLossPercentage': 2,
+        'stopGainPercentage': 2,
+        'baseAssetAmountPerTrade': 10,
+        'sharding': {
+            'workerTtlInSeconds': 60,
+            'heartbeatIntervalInSeconds': 15,
+            'virtualNodesPerWorker': 64,
+            'claimTtlInSeconds': 300,
+        },
+    },
+}
+
+SYMBOLS = ['AUSDT', 'BUSDT', 'CUSDT']
+
+
+class AlwaysTrade(TradingStrategy):
+    def should_place_order(self, df, current_price: float, symbol: str) -> bool:
+        return True
+
+
+class ScriptedExchange():
+    """
+    ScriptedExchange returns, or raises, the given outcome of each order.
+    """
+
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.placed_assets = []
+
+    def get_base_asset_balance(self):
+        return 1000.0
+
+    def get_ongoing_trades(self):
+        return []
+
+    def get_tradable_symbols(self):
+        return set(SYMBOLS)
+
+    def get_market_snapshot(self):
+        return MarketSnapshot(SYMBOLS, [1.0] * len(SYMBOLS), SymbolIndex())
+
+    def place_order(self, asset_to_trade: str, *args, **kwargs):
+        self.placed_assets.append(asset_to_trade)
+        outcome = self.outcomes[asset_to_trade + 'USDT']
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def build_shard(server, worker_id: str) -> Shard:
+    cache = redis.Redis(CONFIG)
+    cache.redis_client = fakeredis.FakeRedis(server=server)
+    return Shard(CONFIG, cache, worker_id)
+
+
+def run_cycle(outcomes):
+    server = fakeredis.FakeServer()
+    exchange = ScriptedExchange(outcomes)
+    bot = ParallelTrader(CONFIG, exchange, [AlwaysTrade({})], shard=build_shard(server, 'worker'))
+    try:
+        bot._ParallelTrader__run_internal()
+    except RuntimeError:
+        pass
+    # a symbol still claimed by the worker can't be claimed by another one.
+    other_shard = build_shard(server, 'other-worker')
+    return exchange, {symbol for symbol in SYMBOLS if not other_shard.claim(symbol)}
+
+
+def test_claims_of_placed_orders_are_kept():
+    _, claimed_symbols = run_cycle({symbol: ({'orderId': 1}, {}) for symbol in SYMBOLS})
+    assert claimed_symbols == set(SYMBOLS)
+
+
+def test_claims_of_rejected_orders_are_released():
+    _, claimed_symbols = run_cycle({'AUSDT': None, 'BUSDT': ({'orderId': 1}, {}), 'CUSDT': None})
+    assert claimed_symbols == {'BUSDT'}
+
+
+def test_claims_of_failed_orders_are_kept_and_pending_ones_released():
+    exchange, claimed_symbols = run_cycle({
+        'AUSDT': ({'orderId': 1}, {}),
+        'BUSDT': RuntimeError('fail to place OCO order'),
+        'CUSDT': ({'orderId': 2}, {}),
+    })
+    assert exchange.placed_assets == ['A', 'B']
+    assert claimed_symbols == {'AUSDT', 'BUSDT'}
@@ -0,0 +1,69 @@
+import numpy
+import pandas
+
+from src.cmd.root import parse_config
+from src.cmd.serial_trader import SerialTrader
+from src.domain.entities import trading_states
+from src.domain.entities.market_snapshot import MarketSnapshot, SymbolIndex
+from src.domain.trading_strategies import TradingStrategy
+
+
+ASSETS = ['ADA', 'BTC', 'ETH']
+
+
+class AlwaysTrade(TradingStrategy):
+    def should_place_order(self, df, current_price: float, symbol: str) -> bool:
+        return True
+
+
+class ScriptedExchange():
+    """
+    ScriptedExchange serves the same klines and prices to every pair, and
+    fails to place the orders of the given assets.
+    """
+
+    def __init__(self, failing_assets):
+        self.failing_assets = failing_assets
+        self.placed_orders = []
+        self.market_snapshot_requests = 0
+
+    def get_trading_state(self, asset_to_trade: str):
+        return trading_states.PENDING
+
+    def get_historical_klines(self, asset_to_trade: str):
+        close = numpy.linspace(1, 2, 210)
+        return pandas.DataFrame({
+            'open_time': numpy.arange(210, dtype=numpy.int64) * 60000,
+            'open': close, 'high': close, 'low': close, 'close': close,
+            'volume': numpy.ones(210),
+        })
+
+    def get_current_price(self, asset_to_trade: str):
+        raise AssertionError('prices must be taken from the market snapshot')
+
+    def get_market_snapshot(self):
+        self.market_snapshot_requests += 1
+        return MarketSnapshot([f'{asset}USDT' for asset in ASSETS], [3.0] * len(ASSETS), SymbolIndex())
+
+    def get_base_asset_balance(self):
+        return 100.0
+
+    def place_order(self, asset_to_trade: str, *args, **kwargs):
+        if asset_to_trade in self.failing_assets:
+            raise RuntimeError('fail to place OCO order')
+        self.placed_orders.append((asset_to_trade, kwargs['current_price']))
+        return {}, {}
+
+
+def test_pairs_are_priced_from_one_snapshot_and_traded_independently():
+    config = parse_config('config/default.yaml')
+    config['serialTrader']['assetsToTrade'] = ASSETS
+    config['serialTrader']['baseAsset'] = 'USDT'
+    config['serialTrader']['plotResults'] = False
+    exchange = ScriptedExchange(failing_assets={'ADA'})
+    bot = SerialTrader(config, exchange, [AlwaysTrade({})])
+
+    bot._SerialTrader__run_internal()
+
+    assert exchange.market_snapshot_requests == 1
+    assert exchange.placed_orders == [('BTC', 3.0), ('ETH', 3.0)]
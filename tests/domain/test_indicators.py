@@ -0,0 +1,84 @@
+import numpy
+import pandas
+import pytest
+
+from src.domain.trading_strategies.indicators import IndicatorMatrix, enrich_klines_with_indicators
+
+
+INTERVAL_IN_MS = 60000
+INDICATORS = ('tp', 'std', 'sma_20', 'sma_50', 'sma_200', 'bollinger_low', 'bollinger_up')
+
+
+def build_klines(size: int, seed: int) -> pandas.DataFrame:
+    random = numpy.random.default_rng(seed)
+    close = 30000 + numpy.cumsum(random.normal(0, 50, size))
+    return pandas.DataFrame({
+        'open_time': numpy.arange(size, dtype=numpy.int64) * INTERVAL_IN_MS,
+        'open': close,
+        'high': close + random.uniform(0, 30, size),
+        'low': close - random.uniform(0, 30, size),
+        'close': close,
+        'volume': random.uniform(0, 10, size),
+    })
+
+
+def assert_matches_pandas(matrix: IndicatorMatrix, symbol: str, klines: pandas.DataFrame):
+    expected = enrich_klines_with_indicators(klines.copy()).iloc[-1]
+    latest = matrix.latest([symbol])
+    for indicator in INDICATORS:
+        if numpy.isnan(expected[indicator]):
+            assert numpy.isnan(latest[indicator][0]), indicator
+        else:
+            assert latest[indicator][0] == pytest.approx(expected[indicator], rel=1e-9), indicator
+
+
+def test_indicators_match_pandas_as_klines_are_appended_and_evicted():
+    klines = build_klines(1000, seed=1)
+    matrix = IndicatorMatrix(['BTCUSDT'], interval_in_ms=INTERVAL_IN_MS)
+
+    for end in range(1, len(klines) + 1):
+        window = klines.iloc[max(end - 3, 0):end]
+        matrix.update_from_klines('BTCUSDT', window)
+        if end % 7 == 0:
+            assert_matches_pandas(matrix, 'BTCUSDT', klines.iloc[:end])
+
+
+def test_open_kline_replaced_in_place():
+    klines = build_klines(300, seed=2)
+    matrix = IndicatorMatrix(['BTCUSDT'], interval_in_ms=INTERVAL_IN_MS)
+    matrix.update_from_klines('BTCUSDT', klines)
+
+    updated_klines = klines.copy()
+    updated_klines.loc[updated_klines.index[-1], ['high', 'close']] += 500
+    matrix.update_from_klines('BTCUSDT', updated_klines.iloc[-2:])
+
+    assert_matches_pandas(matrix, 'BTCUSDT', updated_klines)
+
+
+def test_missing_slots_make_indicators_nan_until_they_leave_the_window():
+    klines = build_klines(500, seed=3)
+    matrix = IndicatorMatrix(['BTCUSDT', 'ETHUSDT'], interval_in_ms=INTERVAL_IN_MS)
+    matrix.update_from_klines('BTCUSDT', klines.iloc[:250])
+    matrix.update_from_klines('ETHUSDT', klines.iloc[:230])
+    # ETHUSDT skips 20 klines, which are missing from its windows.
+    matrix.update_from_klines('BTCUSDT', klines.iloc[250:280])
+    matrix.update_from_klines('ETHUSDT', klines.iloc[250:280])
+
+    latest = matrix.latest(['ETHUSDT'])
+    assert not numpy.isnan(latest['sma_20'][0])
+    assert numpy.isnan(latest['sma_50'][0])
+    assert numpy.isnan(latest['sma_200'][0])
+    assert_matches_pandas(matrix, 'BTCUSDT', klines.iloc[:280])
+
+    for end in range(281, len(klines) + 1):
+        matrix.update_from_klines('ETHUSDT', klines.iloc[end - 1:end])
+    assert_matches_pandas(matrix, 'ETHUSDT', klines)
+
+
+def test_gap_longer_than_capacity_resets_the_matrix():
+    klines = build_klines(600, seed=4)
+    matrix = IndicatorMatrix(['BTCUSDT'], interval_in_ms=INTERVAL_IN_MS)
+    matrix.update_from_klines('BTCUSDT', klines.iloc[:250])
+    matrix.update_from_klines('BTCUSDT', klines.iloc[-220:])
+
+    assert_matches_pandas(matrix, 'BTCUSDT', klines.iloc[-220:].reset_index(drop=True))
@@ -0,0 +1,57 @@
+import time
+
+import fakeredis
+
+from src.cmd.root import parse_config
+from src.domain.exchanges import fake
+from src.domain.sharding import LeaderLock
+from src.domain.trading_strategies import period_max
+from src.gateways.redis import redis
+
+
+class ManualClock():
+    def __init__(self, now: float = 1e9):
+        self.current_time = now
+
+    def now(self) -> float:
+        return self.current_time
+
+
+def build_updater(config, server, owner, clock, ttl_in_seconds):
+    cache = redis.Redis(config)
+    cache.redis_client = fakeredis.FakeRedis(server=server)
+    leader_lock = LeaderLock(cache, period_max.LEADER_LOCK_NAME, owner, ttl_in_seconds)
+    exchange = fake.FakeExchange(config, 'USDT')
+    return period_max.PeriodMaxUpdater(config, exchange, cache, clock, leader_lock), cache
+
+
+def get_generation(cache, config):
+    return cache.get(f'{period_max.build_cache_key_name(config["periodMax"]["periodUsedInDays"])}:generation')
+
+
+def test_only_the_leader_updates_and_a_follower_takes_over():
+    config = parse_config('config/default.yaml')
+    server = fakeredis.FakeServer()
+    clock = ManualClock()
+    leader, cache = build_updater(config, server, 'leader', clock, 0.2)
+    follower, _ = build_updater(config, server, 'follower', clock, 0.2)
+
+    leader.tick()
+    follower.tick()
+    assert get_generation(cache, config) == b'1'
+
+    # the update isn't due yet, but the leadership is renewed.
+    clock.current_time += leader.tick_interval_in_seconds
+    leader.tick()
+    follower.tick()
+    assert get_generation(cache, config) == b'1'
+
+    # the leader stops, and the follower updates right after taking over.
+    time.sleep(0.3)
+    follower.tick()
+    assert get_generation(cache, config) == b'2'
+
+    clock.current_time += follower.seconds_to_update_cache
+    leader.tick()
+    follower.tick()
+    assert get_generation(cache, config) == b'3'
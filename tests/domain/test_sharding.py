@@ -0,0 +1,187 @@
+import time
+
+import fakeredis
+import pytest
+
+from src.domain.sharding import HashRing, LeaderLock, Shard
+from src.gateways.memory import dictionary
+from src.gateways.redis import redis
+
+
+CONFIG = {
+    'redis': {'host': 'localhost', 'port': 6379},
+    'parallelTrader': {
+        'sharding': {
+            'workerTtlInSeconds': 60,
+            'heartbeatIntervalInSeconds': 15,
+            'virtualNodesPerWorker': 64,
+            'claimTtlInSeconds': 300,
+        },
+    },
+}
+
+SYMBOLS = [f'SYMBOL{i}USDT' for i in range(2000)]
+
+
+class ManualClock():
+    def __init__(self, now: float = 1000.0):
+        self.current_time = now
+
+    def now(self) -> float:
+        return self.current_time
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+def build_redis(server) -> redis.Redis:
+    cache = redis.Redis(CONFIG)
+    cache.redis_client = fakeredis.FakeRedis(server=server)
+    return cache
+
+
+@pytest.fixture(params=['redis', 'dictionary'])
+def cache(request, redis_server):
+    if request.param == 'redis':
+        return build_redis(redis_server)
+    return dictionary.Dictionary(CONFIG)
+
+
+def test_hash_ring_is_the_same_in_every_instance():
+    ring = HashRing(['a', 'b', 'c'])
+    other_ring = HashRing(['c', 'a', 'b'])
+    assert [ring.get_node(symbol) for symbol in SYMBOLS] == \
+        [other_ring.get_node(symbol) for symbol in SYMBOLS]
+
+
+def test_hash_ring_spreads_keys_among_nodes():
+    ring = HashRing(['a', 'b', 'c'])
+    nodes = [ring.get_node(symbol) for symbol in SYMBOLS]
+    for node in ('a', 'b', 'c'):
+        assert len(SYMBOLS) / 6 < nodes.count(node) < len(SYMBOLS) / 2
+
+
+def test_hash_ring_only_moves_keys_to_a_joining_node():
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b', 'c', 'd'])
+    moved = [symbol for symbol in SYMBOLS if before.get_node(symbol) != after.get_node(symbol)]
+    assert len(moved) > 0
+    assert all(after.get_node(symbol) == 'd' for symbol in moved)
+
+
+def test_hash_ring_only_moves_keys_of_a_leaving_node():
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'c'])
+    for symbol in SYMBOLS:
+        if before.get_node(symbol) != 'b':
+            assert after.get_node(symbol) == before.get_node(symbol)
+
+
+def test_hash_ring_without_nodes():
+    assert HashRing([]).get_node('SYMBOLUSDT') is None
+
+
+def test_shards_own_each_symbol_exactly_once(redis_server):
+    clock = ManualClock()
+    shards = [Shard(CONFIG, build_redis(redis_server), worker, clock) for worker in ('a', 'b', 'c')]
+    for shard in shards:
+        shard.refresh()
+    # the first workers only see the others on their next refresh.
+    clock.current_time += 15
+    for shard in shards:
+        shard.refresh()
+
+    for shard in shards:
+        assert shard.workers == ['a', 'b', 'c']
+    for symbol in SYMBOLS:
+        assert sum(shard.owns(symbol) for shard in shards) == 1
+
+
+def test_shard_refresh_expires_workers_without_heartbeat(redis_server):
+    clock = ManualClock()
+    alive = Shard(CONFIG, build_redis(redis_server), 'alive', clock)
+    dead = Shard(CONFIG, build_redis(redis_server), 'dead', clock)
+    dead.refresh()
+    alive.refresh()
+    assert alive.workers == ['alive', 'dead']
+
+    clock.current_time += 61
+    alive.refresh()
+    assert alive.workers == ['alive']
+    assert all(alive.owns(symbol) for symbol in SYMBOLS)
+    assert list(build_redis(redis_server).hgetall(Shard.WORKERS_KEY_NAME)) == ['alive']
+
+
+def test_shard_refresh_is_limited_to_the_heartbeat_interval(redis_server):
+    clock = ManualClock()
+    shard = Shard(CONFIG, build_redis(redis_server), 'a', clock)
+    shard.refresh()
+    Shard(CONFIG, build_redis(redis_server), 'b', clock).refresh()
+
+    clock.current_time += 14
+    shard.refresh()
+    assert shard.workers == ['a']
+
+    clock.current_time += 1
+    shard.refresh()
+    assert shard.workers == ['a', 'b']
+
+
+def test_shard_claims_are_exclusive_until_released(cache):
+    shard = Shard(CONFIG, cache, 'a', ManualClock())
+    other_shard = Shard(CONFIG, cache, 'b', ManualClock())
+
+    assert shard.claim('SYMBOLUSDT')
+    assert shard.claim('SYMBOLUSDT')
+    assert not other_shard.claim('SYMBOLUSDT')
+
+    other_shard.release('SYMBOLUSDT')
+    assert not other_shard.claim('SYMBOLUSDT')
+
+    shard.release('SYMBOLUSDT')
+    assert other_shard.claim('SYMBOLUSDT')
+
+
+def test_lock_is_exclusive_while_held(cache):
+    assert cache.acquire_lock('lock', 'a', 10)
+    assert not cache.acquire_lock('lock', 'b', 10)
+
+
+def test_lock_is_renewed_by_its_owner(cache):
+    assert cache.acquire_lock('lock', 'a', 0.2)
+    time.sleep(0.1)
+    assert cache.acquire_lock('lock', 'a', 0.2)
+    time.sleep(0.15)
+    # still held thanks to the renewal.
+    assert not cache.acquire_lock('lock', 'b', 0.2)
+
+
+def test_lock_is_stolen_after_expiring(cache):
+    assert cache.acquire_lock('lock', 'a', 0.05)
+    time.sleep(0.1)
+    assert cache.acquire_lock('lock', 'b', 10)
+    assert not cache.acquire_lock('lock', 'a', 10)
+
+
+def test_lock_is_only_released_by_its_owner(cache):
+    assert cache.acquire_lock('lock', 'a', 10)
+    cache.release_lock('lock', 'b')
+    assert not cache.acquire_lock('lock', 'b', 10)
+
+    cache.release_lock('lock', 'a')
+    assert cache.acquire_lock('lock', 'b', 10)
+
+
+def test_leader_lock_elects_a_single_leader(cache):
+    leader = LeaderLock(cache, 'leader', 'a', 10)
+    follower = LeaderLock(cache, 'leader', 'b', 10)
+
+    assert leader.is_leader()
+    assert not follower.is_leader()
+    assert leader.is_leader()
+
+    leader.release()
+    assert follower.is_leader()
+    assert not leader.is_leader()
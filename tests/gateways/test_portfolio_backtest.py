@@ -0,0 +1,73 @@
+import numpy
+import pandas
+import pytest
+
+from src.gateways.backtest import historical_data_manager, portfolio_backtest
+
+
+MINUTE_IN_MS = 60 * 1000
+
+
+def build_config(path, intrabar=True, refinement_interval_in_minutes=1):
+    return {
+        'binance': {'taxPerTransaction': 0},
+        'binanceSimulator': {
+            'intervalInMinutes': 3,
+            'numberOfIntervals': 100,
+            'historicalData': {'path': str(path), 'downloadMissingData': False},
+            'exits': {
+                'intrabar': intrabar,
+                'refinementIntervalInMinutes': refinement_interval_in_minutes,
+            },
+            'portfolio': {'initialBalance': 1000, 'symbols': []},
+        },
+    }
+
+
+def build_klines(interval_in_minutes, high, low, close):
+    size = len(close)
+    columns = {column: numpy.zeros(size) for column, _ in historical_data_manager.COLUMNS}
+    columns.update({
+        'open_time': numpy.arange(size, dtype=numpy.int64) * interval_in_minutes * MINUTE_IN_MS,
+        'open': numpy.asarray(close, dtype=float),
+        'high': numpy.asarray(high, dtype=float),
+        'low': numpy.asarray(low, dtype=float),
+        'close': numpy.asarray(close, dtype=float),
+    })
+    return pandas.DataFrame(columns)
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    data_manager = historical_data_manager.HistoricalDataManager(build_config(tmp_path))
+    # the second bar crosses both the gain (110) and the loss (90) prices...
+    data_manager.append('ABCUSDT', '3m', build_klines(
+        3, high=[100, 120, 100], low=[100, 80, 100], close=[100, 100, 100]))
+    # ...and its 1 minute klines show the gain was crossed first.
+    data_manager.append('ABCUSDT', '1m', build_klines(
+        1, high=[100, 100, 100, 120, 100, 100, 100, 100, 100],
+        low=[100, 100, 100, 100, 80, 100, 100, 100, 100],
+        close=[100] * 9))
+    return tmp_path
+
+
+def run_trade(config):
+    exchange = portfolio_backtest.PortfolioBacktest(config, 'USDT')
+    exchange.place_order('ABC', 100, stop_loss_percentage=10, stop_gain_percentage=10)
+    exchange.clock.advance(1)
+    return exchange.get_results()
+
+
+def test_bar_crossing_both_prices_is_refined_with_lower_timeframe(data_path):
+    results = run_trade(build_config(data_path))
+    assert (results.gains, results.losses) == (1, 0)
+
+
+def test_bar_crossing_both_prices_is_a_loss_without_refinement(data_path):
+    results = run_trade(build_config(data_path, refinement_interval_in_minutes=0))
+    assert (results.gains, results.losses) == (0, 1)
+
+
+def test_only_close_prices_are_checked_without_intrabar_exits(data_path):
+    results = run_trade(build_config(data_path, intrabar=False))
+    assert (results.gains, results.losses, results.open_positions) == (0, 0, 1)